@@ -3,16 +3,25 @@ Alert service for Drugstore Canary
 Handles alert generation, notification, and management
 """
 import requests
+from requests.adapters import HTTPAdapter
+from sqlalchemy import and_, exists, func
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional
 import sys
 from pathlib import Path
 
-sys.path.append(str(Path(__file__).parent.parent))
+if __name__ == "__main__":
+    sys.path.append(str(Path(__file__).parent.parent))
 
 from data.database import get_session, Alert, Zone
 from config import ALERT_CONFIG, LINE_NOTIFY_TOKEN
 
+LINE_NOTIFY_URL = "https://notify-api.line.me/api/notify"
+
+# Shared HTTP session so LINE Notify connections are kept alive between alerts
+_http = requests.Session()
+_http.mount("https://", HTTPAdapter(pool_connections=10, pool_maxsize=10))
+
 
 class AlertService:
     """Manage alerts and notifications"""
@@ -20,6 +29,7 @@ class AlertService:
     def __init__(self):
         self.session = get_session()
         self.config = ALERT_CONFIG
+        self._zone_names: Optional[Dict[str, str]] = None
         
     def create_alert(
         self,
@@ -65,7 +75,7 @@ class AlertService:
         
         # Send notification
         if self.config["enable_notifications"]:
-            self._send_notification(alert)
+            self._send_notification(alert, self._get_zone_name(zone_id))
         
         return alert
     
@@ -83,20 +93,64 @@ class AlertService:
         cooldown_hours = self.config["cooldown_period_hours"]
         cutoff_time = datetime.utcnow() - timedelta(hours=cooldown_hours)
         
-        recent_alert = self.session.query(Alert).filter(
-            Alert.zone_id == zone_id,
-            Alert.medicine_category == medicine_category,
-            Alert.detected_at >= cutoff_time
-        ).first()
+        in_cooldown = self.session.query(
+            exists().where(and_(
+                Alert.zone_id == zone_id,
+                Alert.medicine_category == medicine_category,
+                Alert.detected_at >= cutoff_time
+            ))
+        ).scalar()
         
-        return recent_alert is None
+        return not in_cooldown
     
-    def _send_notification(self, alert: Alert) -> bool:
+    def _get_zone_name(self, zone_id: str) -> str:
+        """
+        Look up a zone's display name from a per-session cache
+        
+        Zone names are loaded with a single query on first use so that
+        sending many notifications does not issue one Zone query each.
+        
+        Args:
+            zone_id: Zone identifier
+            
+        Returns:
+            Zone name, or the zone_id if the zone is unknown
+        """
+        if self._zone_names is None:
+            self._zone_names = dict(
+                self.session.query(Zone.id, Zone.name).all()
+            )
+        
+        return self._zone_names.get(zone_id, zone_id)
+    
+    def _format_notification(self, alert: Alert, zone_name: str) -> str:
+        """Format a single alert for LINE Notify"""
+        return (
+            f"\n🚨 Drugstore Canary Alert\n"
+            f"พื้นที่: {zone_name}\n"
+            f"ประเภทยา: {alert.medicine_category}\n"
+            f"ระดับ: {alert.alert_level}\n"
+            f"ความมั่นใจ: {alert.confidence*100:.0f}%\n"
+            f"เวลา: {alert.detected_at.strftime('%Y-%m-%d %H:%M')}\n"
+            f"\n{alert.message}"
+        )
+    
+    def _post_notification(self, notification_message: str) -> bool:
+        """Post a message to LINE Notify over the shared HTTP session"""
+        headers = {"Authorization": f"Bearer {LINE_NOTIFY_TOKEN}"}
+        data = {"message": notification_message}
+        
+        response = _http.post(LINE_NOTIFY_URL, headers=headers, data=data)
+        
+        return response.status_code == 200
+    
+    def _send_notification(self, alert: Alert, zone_name: Optional[str] = None) -> bool:
         """
         Send notification via LINE Notify
         
         Args:
             alert: Alert object
+            zone_name: Zone display name (looked up from cache if omitted)
             
         Returns:
             True if successful, False otherwise
@@ -106,36 +160,13 @@ class AlertService:
             return False
         
         try:
-            # Get zone name
-            zone = self.session.query(Zone).filter(
-                Zone.id == alert.zone_id
-            ).first()
-            
-            zone_name = zone.name if zone else alert.zone_id
-            
-            # Format message
-            notification_message = (
-                f"\n🚨 Drugstore Canary Alert\n"
-                f"พื้นที่: {zone_name}\n"
-                f"ประเภทยา: {alert.medicine_category}\n"
-                f"ระดับ: {alert.alert_level}\n"
-                f"ความมั่นใจ: {alert.confidence*100:.0f}%\n"
-                f"เวลา: {alert.detected_at.strftime('%Y-%m-%d %H:%M')}\n"
-                f"\n{alert.message}"
-            )
+            if zone_name is None:
+                zone_name = self._get_zone_name(alert.zone_id)
             
-            # Send to LINE Notify
-            headers = {"Authorization": f"Bearer {LINE_NOTIFY_TOKEN}"}
-            data = {"message": notification_message}
-            
-            response = requests.post(
-                "https://notify-api.line.me/api/notify",
-                headers=headers,
-                data=data
+            return self._post_notification(
+                self._format_notification(alert, zone_name)
             )
             
-            return response.status_code == 200
-            
         except Exception as e:
             print(f"Error sending notification: {e}")
             return False
@@ -198,16 +229,13 @@ class AlertService:
         """
         cutoff_date = datetime.utcnow() - timedelta(days=days)
         
-        old_alerts = self.session.query(Alert).filter(
+        count = self.session.query(Alert).filter(
             Alert.is_active == True,
             Alert.detected_at < cutoff_date
-        ).all()
-        
-        count = 0
-        for alert in old_alerts:
-            alert.is_active = False
-            alert.resolved_at = datetime.utcnow()
-            count += 1
+        ).update(
+            {Alert.is_active: False, Alert.resolved_at: datetime.utcnow()},
+            synchronize_session=False
+        )
         
         self.session.commit()
         
@@ -220,22 +248,24 @@ class AlertService:
         Returns:
             Dictionary with alert statistics
         """
-        active_alerts = self.session.query(Alert).filter(
-            Alert.is_active == True
-        ).all()
-        
         # Count by severity
-        severity_counts = {}
-        for alert in active_alerts:
-            severity_counts[alert.alert_level] = severity_counts.get(alert.alert_level, 0) + 1
+        severity_counts = dict(
+            self.session.query(Alert.alert_level, func.count())
+            .filter(Alert.is_active == True)
+            .group_by(Alert.alert_level)
+            .all()
+        )
         
         # Count by zone
-        zone_counts = {}
-        for alert in active_alerts:
-            zone_counts[alert.zone_id] = zone_counts.get(alert.zone_id, 0) + 1
+        zone_counts = dict(
+            self.session.query(Alert.zone_id, func.count())
+            .filter(Alert.is_active == True)
+            .group_by(Alert.zone_id)
+            .all()
+        )
         
         return {
-            "total_active": len(active_alerts),
+            "total_active": sum(severity_counts.values()),
             "by_severity": severity_counts,
             "by_zone": zone_counts,
             "last_updated": datetime.utcnow().isoformat()
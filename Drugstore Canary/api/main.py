@@ -2,21 +2,46 @@
 FastAPI backend for Drugstore Canary
 Provides REST API for data ingestion, anomaly detection, and alerts
 """
-from fastapi import FastAPI, HTTPException, Depends, BackgroundTasks
+from fastapi import FastAPI, HTTPException, Depends, BackgroundTasks, Response
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from datetime import datetime, timedelta
-from typing import List, Optional, Dict
+from typing import List, Optional, Dict, Tuple
+from weakref import WeakValueDictionary
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import threading
+import numpy as np
+import pandas as pd
+from functools import lru_cache
 import sys
 from pathlib import Path
+from sqlalchemy import case, func, insert
+from sqlalchemy.orm import Session
 
-sys.path.append(str(Path(__file__).parent.parent))
+if __name__ == "__main__":
+    sys.path.append(str(Path(__file__).parent.parent))
 
-from data.database import get_session, PharmacySales, MedicineType, Pharmacy, Zone, Alert
+from data.database import get_session, get_db, PharmacySales, MedicineType, Pharmacy, Zone, Alert
 from data.preprocessor import DataPreprocessor
 from models.ensemble_model import EnsembleDetector
 from config import API_CONFIG, HAT_YAI_ZONES, MEDICINE_CATEGORIES
 
+# Severity levels from lowest to highest, with their rank lookup
+_SEVERITY_ORDER = ["normal", "low", "medium", "high", "critical"]
+_SEVERITY_RANK = {level: rank for rank, level in enumerate(_SEVERITY_ORDER)}
+
+# Valid identifiers for request validation
+_ZONE_IDS = frozenset(HAT_YAI_ZONES)
+_CATEGORY_IDS = frozenset(MEDICINE_CATEGORIES)
+
+# Zones and categories come from static config
+STATIC_CACHE_CONTROL = "public, max-age=3600"
+
+# Upper bound on rows returned by /api/alerts
+MAX_ALERTS_LIMIT = 1000
+
 # Initialize FastAPI app
 app = FastAPI(
     title="Drugstore Canary API",
@@ -74,6 +99,81 @@ class PredictionResponse(BaseModel):
     message: Optional[str]
 
 
+# Reference data lookups (medicine types and pharmacies rarely change)
+_medicine_ids: Dict[str, int] = {}
+_pharmacy_zones: Dict[str, str] = {}
+
+def _get_medicine_id(session: Session, category: str) -> Optional[int]:
+    """Get the medicine_id recorded for a category, querying only on cache miss"""
+    if category not in _medicine_ids:
+        medicine_id = session.query(MedicineType.id).filter(
+            MedicineType.category == category
+        ).order_by(MedicineType.id).limit(1).scalar()
+        
+        if medicine_id is None:
+            return None
+        _medicine_ids[category] = medicine_id
+    
+    return _medicine_ids[category]
+
+def _get_pharmacy_zone(session: Session, pharmacy_id: str) -> Optional[str]:
+    """Get a pharmacy's zone_id, querying only on cache miss"""
+    if pharmacy_id not in _pharmacy_zones:
+        zone_id = session.query(Pharmacy.zone_id).filter(
+            Pharmacy.id == pharmacy_id
+        ).scalar()
+        
+        if zone_id is None:
+            return None
+        _pharmacy_zones[pharmacy_id] = zone_id
+    
+    return _pharmacy_zones[pharmacy_id]
+
+
+# Trained ensembles per zone-category pair, reused while their input data is
+# unchanged (most recently used last). Shared by /api/predict and background
+# detection, which run in the same process; each uvicorn worker keeps its own.
+ENSEMBLE_CACHE_TTL = timedelta(hours=1)
+ENSEMBLE_CACHE_SIZE = 16
+_ensemble_cache: "OrderedDict[Tuple[str, str], Tuple[Tuple, datetime, EnsembleDetector]]" = OrderedDict()
+_ensemble_cache_lock = threading.Lock()
+
+def _get_trained_ensemble(
+    zone_id: str,
+    category: str,
+    df_prophet: pd.DataFrame,
+    X_lstm: np.ndarray,
+    y_lstm: np.ndarray
+) -> EnsembleDetector:
+    """Get a trained ensemble, re-training only if the data changed or the entry expired"""
+    key = (zone_id, category)
+    signature = (
+        len(df_prophet),
+        df_prophet["ds"].iloc[0],
+        df_prophet["ds"].iloc[-1],
+        float(df_prophet["y"].sum())
+    )
+    
+    with _ensemble_cache_lock:
+        cached = _ensemble_cache.get(key)
+        if cached:
+            cached_signature, trained_at, ensemble = cached
+            if cached_signature == signature and datetime.now() - trained_at < ENSEMBLE_CACHE_TTL:
+                _ensemble_cache.move_to_end(key)
+                return ensemble
+    
+    ensemble = EnsembleDetector()
+    ensemble.train(df_prophet, X_lstm, y_lstm)
+    
+    with _ensemble_cache_lock:
+        _ensemble_cache[key] = (signature, datetime.now(), ensemble)
+        _ensemble_cache.move_to_end(key)
+        if len(_ensemble_cache) > ENSEMBLE_CACHE_SIZE:
+            _ensemble_cache.popitem(last=False)
+    
+    return ensemble
+
+
 # API Endpoints
 
 @app.get("/")
@@ -86,40 +186,37 @@ async def root():
     }
 
 @app.post("/api/sales")
-async def add_sales_data(sales: SalesData, background_tasks: BackgroundTasks):
+async def add_sales_data(
+    sales: SalesData,
+    background_tasks: BackgroundTasks,
+    session: Session = Depends(get_db)
+):
     """
     Add new sales data and trigger anomaly detection
     """
-    session = get_session()
-    
     try:
         # Get medicine_id
-        medicine = session.query(MedicineType).filter(
-            MedicineType.category == sales.medicine_category
-        ).first()
+        medicine_id = _get_medicine_id(session, sales.medicine_category)
         
-        if not medicine:
+        if medicine_id is None:
             raise HTTPException(status_code=400, detail="Invalid medicine category")
         
         # Add sales record
-        sale = PharmacySales(
+        session.execute(insert(PharmacySales).values(
             pharmacy_id=sales.pharmacy_id,
-            medicine_id=medicine.id,
+            medicine_id=medicine_id,
             date=sales.date,
             quantity_sold=sales.quantity_sold
-        )
-        session.add(sale)
+        ))
         session.commit()
         
         # Trigger background anomaly detection
-        pharmacy = session.query(Pharmacy).filter(
-            Pharmacy.id == sales.pharmacy_id
-        ).first()
+        zone_id = _get_pharmacy_zone(session, sales.pharmacy_id)
         
-        if pharmacy:
+        if zone_id:
             background_tasks.add_task(
                 run_anomaly_detection,
-                pharmacy.zone_id,
+                zone_id,
                 sales.medicine_category
             )
         
@@ -133,109 +230,106 @@ async def add_sales_data(sales: SalesData, background_tasks: BackgroundTasks):
     except Exception as e:
         session.rollback()
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        session.close()
 
 @app.get("/api/alerts", response_model=List[AlertResponse])
 async def get_alerts(
     zone_id: Optional[str] = None,
     active_only: bool = True,
-    limit: int = 50
+    limit: int = 50,
+    session: Session = Depends(get_db)
 ):
     """
     Get alerts with optional filtering
     """
-    session = get_session()
+    # Select only the columns needed for the response
+    query = session.query(
+        Alert.id,
+        Alert.zone_id,
+        Zone.name.label("zone_name"),
+        Alert.medicine_category,
+        Alert.alert_level,
+        Alert.anomaly_score,
+        Alert.confidence,
+        Alert.detected_at,
+        Alert.message,
+        Alert.is_active
+    ).join(Zone, Alert.zone_id == Zone.id)
     
-    try:
-        query = session.query(Alert, Zone).join(Zone, Alert.zone_id == Zone.id)
-        
-        if zone_id:
-            query = query.filter(Alert.zone_id == zone_id)
-        
-        if active_only:
-            query = query.filter(Alert.is_active == True)
-        
-        query = query.order_by(Alert.detected_at.desc()).limit(limit)
-        
-        results = query.all()
-        
-        alerts = []
-        for alert, zone in results:
-            alerts.append(AlertResponse(
-                id=alert.id,
-                zone_id=alert.zone_id,
-                zone_name=zone.name,
-                medicine_category=alert.medicine_category,
-                alert_level=alert.alert_level,
-                anomaly_score=alert.anomaly_score,
-                confidence=alert.confidence or 0.0,
-                detected_at=alert.detected_at,
-                message=alert.message or "",
-                is_active=alert.is_active
-            ))
-        
-        return alerts
-        
-    finally:
-        session.close()
+    if zone_id:
+        query = query.filter(Alert.zone_id == zone_id)
+    
+    if active_only:
+        query = query.filter(Alert.is_active == True)
+    
+    query = query.order_by(Alert.detected_at.desc()).limit(
+        max(0, min(limit, MAX_ALERTS_LIMIT))
+    )
+    
+    results = query.all()
+    
+    return [
+        AlertResponse(
+            id=row.id,
+            zone_id=row.zone_id,
+            zone_name=row.zone_name,
+            medicine_category=row.medicine_category,
+            alert_level=row.alert_level,
+            anomaly_score=row.anomaly_score,
+            confidence=row.confidence or 0.0,
+            detected_at=row.detected_at,
+            message=row.message or "",
+            is_active=row.is_active
+        )
+        for row in results
+    ]
 
 @app.get("/api/zones/{zone_id}/status", response_model=ZoneStatus)
-async def get_zone_status(zone_id: str):
+async def get_zone_status(zone_id: str, session: Session = Depends(get_db)):
     """
     Get current status for a specific zone
     """
-    if zone_id not in HAT_YAI_ZONES:
+    if zone_id not in _ZONE_IDS:
         raise HTTPException(status_code=404, detail="Zone not found")
     
-    session = get_session()
+    # Rank severities so the database can take the maximum
+    severity_rank = case(_SEVERITY_RANK, value=Alert.alert_level, else_=0)
     
-    try:
-        # Get active alerts for zone
-        alerts = session.query(Alert).filter(
-            Alert.zone_id == zone_id,
-            Alert.is_active == True
-        ).all()
-        
-        if not alerts:
-            return ZoneStatus(
-                zone_id=zone_id,
-                zone_name=HAT_YAI_ZONES[zone_id]["name"],
-                active_alerts=0,
-                highest_severity="normal",
-                categories_at_risk=[]
-            )
-        
-        # Determine highest severity
-        severity_order = ["normal", "low", "medium", "high", "critical"]
-        highest_severity = max(
-            [a.alert_level for a in alerts],
-            key=lambda x: severity_order.index(x)
-        )
-        
-        # Get categories at risk
-        categories_at_risk = list(set([a.medicine_category for a in alerts]))
-        
+    # Aggregate active alerts for zone, one row per category
+    rows = session.query(
+        Alert.medicine_category,
+        func.count(),
+        func.max(severity_rank)
+    ).filter(
+        Alert.zone_id == zone_id,
+        Alert.is_active == True
+    ).group_by(Alert.medicine_category).all()
+    
+    if not rows:
         return ZoneStatus(
             zone_id=zone_id,
             zone_name=HAT_YAI_ZONES[zone_id]["name"],
-            active_alerts=len(alerts),
-            highest_severity=highest_severity,
-            categories_at_risk=categories_at_risk
+            active_alerts=0,
+            highest_severity="normal",
+            categories_at_risk=[]
         )
-        
-    finally:
-        session.close()
+    
+    return ZoneStatus(
+        zone_id=zone_id,
+        zone_name=HAT_YAI_ZONES[zone_id]["name"],
+        active_alerts=sum(count for _, count, _ in rows),
+        highest_severity=_SEVERITY_ORDER[max(rank for _, _, rank in rows)],
+        categories_at_risk=[category for category, _, _ in rows]
+    )
 
 @app.post("/api/predict", response_model=PredictionResponse)
 async def predict_anomaly(request: PredictionRequest):
     """
     Run anomaly detection for a specific zone and category
     """
-    if request.zone_id not in HAT_YAI_ZONES:
+    if request.zone_id not in _ZONE_IDS:
         raise HTTPException(status_code=404, detail="Zone not found")
     
-    if request.category not in MEDICINE_CATEGORIES:
+    if request.category not in _CATEGORY_IDS:
         raise HTTPException(status_code=400, detail="Invalid medicine category")
     
     try:
@@ -275,19 +369,19 @@ async def predict_anomaly(request: PredictionRequest):
             )
         
         # Run ensemble detection
-        ensemble = EnsembleDetector()
-        ensemble.train(df_prophet, X_lstm, y_lstm)
-        results = ensemble.detect_anomalies(df_prophet, X_lstm, y_lstm)
+        ensemble = _get_trained_ensemble(
+            request.zone_id, request.category, df_prophet, X_lstm, y_lstm
+        )
+        results = ensemble.detect_anomalies_fast(df_prophet, X_lstm, y_lstm)
         
-        # Get latest result
-        latest = results.iloc[-1]
         confidence = ensemble.calculate_confidence(results)
         
         # Generate alert if needed
         alert_data = ensemble.get_alert_message(
             results,
             request.zone_id,
-            request.category
+            request.category,
+            confidence=confidence
         )
         
         preprocessor.close()
@@ -295,19 +389,19 @@ async def predict_anomaly(request: PredictionRequest):
         return PredictionResponse(
             zone_id=request.zone_id,
             category=request.category,
-            is_anomaly=bool(latest["is_anomaly"]),
-            severity=latest["severity"],
+            is_anomaly=bool(results.is_anomaly[-1]),
+            severity=results.severity[-1],
             confidence=float(confidence),
-            ensemble_score=float(latest["ensemble_score"]),
+            ensemble_score=float(results.ensemble_score[-1]),
             message=alert_data["message"] if alert_data else None
         )
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.get("/api/zones")
-async def get_zones():
-    """Get all zones"""
+@lru_cache(maxsize=1)
+def _build_zones() -> List[Dict]:
+    """Build the zone listing from config once"""
     zones = []
     for zone_id, zone_data in HAT_YAI_ZONES.items():
         zones.append({
@@ -319,17 +413,89 @@ async def get_zones():
         })
     return zones
 
+@lru_cache(maxsize=1)
+def _build_categories() -> List[str]:
+    """Build the category listing from config once"""
+    return list(MEDICINE_CATEGORIES.keys())
+
+@app.get("/api/zones")
+async def get_zones(response: Response):
+    """Get all zones"""
+    response.headers["Cache-Control"] = STATIC_CACHE_CONTROL
+    return _build_zones()
+
 @app.get("/api/categories")
-async def get_categories():
+async def get_categories(response: Response):
     """Get all medicine categories"""
-    return list(MEDICINE_CATEGORIES.keys())
+    response.headers["Cache-Control"] = STATIC_CACHE_CONTROL
+    return _build_categories()
 
 
 # Background tasks
 
+# Background detection runs in threads of the API process: forked workers would
+# inherit TensorFlow, Prophet and SQLAlchemy state, and the heavy numeric work
+# releases the GIL anyway
+DETECTION_WORKERS = 2
+
+_detection_executor: Optional[ThreadPoolExecutor] = None
+
+def _get_detection_executor() -> ThreadPoolExecutor:
+    """Get the thread pool used for background anomaly detection"""
+    global _detection_executor
+    if _detection_executor is None:
+        _detection_executor = ThreadPoolExecutor(
+            max_workers=DETECTION_WORKERS,
+            thread_name_prefix="detection"
+        )
+    return _detection_executor
+
+@app.on_event("shutdown")
+def shutdown_detection_executor():
+    """Stop background detection workers"""
+    if _detection_executor is not None:
+        _detection_executor.shutdown(wait=False, cancel_futures=True)
+
+# Minimum time between re-trainings for the same zone-category pair
+DETECTION_MIN_INTERVAL = timedelta(minutes=5)
+
+_detection_locks: "WeakValueDictionary[Tuple[str, str], asyncio.Lock]" = WeakValueDictionary()
+_last_detection: Dict[Tuple[str, str], datetime] = {}
+
 async def run_anomaly_detection(zone_id: str, category: str):
     """
     Background task to run anomaly detection and create alerts
+    
+    Runs for the same zone-category pair are coalesced: a run is skipped
+    if one is already in progress or completed within DETECTION_MIN_INTERVAL.
+    A failed run does not count, so the next request retries right away.
+    """
+    key = (zone_id, category)
+    lock = _detection_locks.setdefault(key, asyncio.Lock())
+    
+    if lock.locked():
+        return
+    
+    last_run = _last_detection.get(key)
+    if last_run and datetime.now() - last_run < DETECTION_MIN_INTERVAL:
+        return
+    
+    async with lock:
+        # Training is CPU-bound; run it off the event loop
+        loop = asyncio.get_running_loop()
+        completed = await loop.run_in_executor(
+            _get_detection_executor(), _detect_and_alert, zone_id, category
+        )
+        
+        if completed:
+            _last_detection[key] = datetime.now()
+
+def _detect_and_alert(zone_id: str, category: str) -> bool:
+    """
+    Train the ensemble on recent data and store an alert if warranted
+    
+    Returns:
+        True if the run completed (with or without enough data), False on error
     """
     try:
         preprocessor = DataPreprocessor()
@@ -345,19 +511,18 @@ async def run_anomaly_detection(zone_id: str, category: str):
         )
         
         if df_prophet.empty or len(df_prophet) < 30:
-            return
+            return True
         
         X_lstm, y_lstm, _ = preprocessor.prepare_for_lstm(
             zone_id, category, 14, start_date, end_date
         )
         
         if len(X_lstm) == 0:
-            return
+            return True
         
         # Run detection
-        ensemble = EnsembleDetector()
-        ensemble.train(df_prophet, X_lstm, y_lstm)
-        results = ensemble.detect_anomalies(df_prophet, X_lstm, y_lstm)
+        ensemble = _get_trained_ensemble(zone_id, category, df_prophet, X_lstm, y_lstm)
+        results = ensemble.detect_anomalies_fast(df_prophet, X_lstm, y_lstm)
         
         # Check for alert
         alert_data = ensemble.get_alert_message(results, zone_id, category)
@@ -378,9 +543,11 @@ async def run_anomaly_detection(zone_id: str, category: str):
         
         preprocessor.close()
         session.close()
+        return True
         
     except Exception as e:
         print(f"Error in anomaly detection: {e}")
+        return False
 
 
 if __name__ == "__main__":
@@ -4,15 +4,44 @@ Runs scrapers at scheduled intervals
 """
 import asyncio
 import json
+import os
 from datetime import datetime, timedelta
+from functools import lru_cache
 from pathlib import Path
 from typing import Dict, List
 import sys
 
-sys.path.append(str(Path(__file__).parent.parent))
+if __name__ == "__main__":
+    sys.path.append(str(Path(__file__).parent.parent))
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 from bots.grab_scraper import GrabScraper
 from bots.lineman_scraper import LinemanScraper
+from bots.playwright_scraper import browser_pool
+
+
+KEY_ITEMS_PATH = Path(__file__).parent / "key_items.json"
+
+# Delay between starting concurrent Grab pharmacy scrapes (seconds)
+GRAB_STAGGER_SECONDS = 10
+
+
+def _dumps(obj) -> bytes:
+    """Serialize results as indented UTF-8 JSON (orjson when available)"""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(obj, indent=2, ensure_ascii=False).encode("utf-8")
+
+
+@lru_cache(maxsize=1)
+def _load_key_items() -> Dict:
+    """Load key_items.json once per process"""
+    data = KEY_ITEMS_PATH.read_bytes()
+    return orjson.loads(data) if orjson is not None else json.loads(data)
 
 
 class BotScheduler:
@@ -25,9 +54,7 @@ class BotScheduler:
         self.results_dir.mkdir(exist_ok=True)
         
         # Load key items
-        key_items_path = Path(__file__).parent / "key_items.json"
-        with open(key_items_path) as f:
-            self.key_items = json.load(f)
+        self.key_items = _load_key_items()
         
         # Extract high-priority keywords
         self.item_categories = {
@@ -48,30 +75,12 @@ class BotScheduler:
             print(f"🟢 Running Grab Scraper - {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
             print(f"{'='*60}")
         
-        all_results = []
-        
-        for pharmacy in self.pharmacies:
-            try:
-                async with GrabScraper(headless=True, debug=self.debug) as scraper:
-                    result = await scraper.scrape_pharmacy_stock(
-                        pharmacy_name=pharmacy,
-                        item_categories=self.item_categories,
-                        location="Hat Yai"
-                    )
-                    all_results.append(result)
-                    
-                    # Small delay between pharmacies
-                    await asyncio.sleep(30)
-            
-            except Exception as e:
-                if self.debug:
-                    print(f"❌ Grab scraper error for {pharmacy}: {e}")
-                all_results.append({
-                    "pharmacy_name": pharmacy,
-                    "platform": "grab",
-                    "error": str(e),
-                    "timestamp": datetime.now().isoformat()
-                })
+        # Scrape pharmacies concurrently, staggering start times so
+        # requests to Grab are still spread out
+        all_results = await asyncio.gather(*(
+            self._scrape_grab_pharmacy(pharmacy, start_delay=idx * GRAB_STAGGER_SECONDS)
+            for idx, pharmacy in enumerate(self.pharmacies)
+        ))
         
         return {
             "platform": "grab",
@@ -79,6 +88,28 @@ class BotScheduler:
             "pharmacies": all_results
         }
     
+    async def _scrape_grab_pharmacy(self, pharmacy: str, start_delay: float = 0) -> Dict:
+        """Scrape a single pharmacy on Grab, returning an error result on failure"""
+        await asyncio.sleep(start_delay)
+        
+        try:
+            async with GrabScraper(headless=True, debug=self.debug) as scraper:
+                return await scraper.scrape_pharmacy_stock(
+                    pharmacy_name=pharmacy,
+                    item_categories=self.item_categories,
+                    location="Hat Yai"
+                )
+        
+        except Exception as e:
+            if self.debug:
+                print(f"❌ Grab scraper error for {pharmacy}: {e}")
+            return {
+                "pharmacy_name": pharmacy,
+                "platform": "grab",
+                "error": str(e),
+                "timestamp": datetime.now().isoformat()
+            }
+    
     async def run_lineman_scraper(self) -> Dict:
         """Run Lineman scraper"""
         if self.debug:
@@ -128,16 +159,19 @@ class BotScheduler:
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
         filename = self.results_dir / f"stock_check_{timestamp}.json"
         
-        with open(filename, 'w', encoding='utf-8') as f:
-            json.dump(results, f, indent=2, ensure_ascii=False)
+        # Encode once and reuse the bytes for both files
+        data = _dumps(results)
+        filename.write_bytes(data)
         
         if self.debug:
             print(f"\n💾 Results saved to: {filename}")
         
-        # Also save to latest.json for easy access
+        # Also save to latest.json for easy access (atomic replace so
+        # readers never see a partially written file)
         latest_file = self.results_dir / "latest.json"
-        with open(latest_file, 'w', encoding='utf-8') as f:
-            json.dump(results, f, indent=2, ensure_ascii=False)
+        tmp_file = latest_file.with_suffix(".json.tmp")
+        tmp_file.write_bytes(data)
+        os.replace(tmp_file, latest_file)
     
     async def start_scheduled_monitoring(self):
         """Start continuous monitoring at scheduled intervals"""
@@ -163,25 +197,14 @@ class BotScheduler:
                 # Run all scrapers
                 results = await self.run_all_scrapers()
                 
-                # Calculate summary
+                # Calculate summary from the counts each scraper keeps
+                # (Lineman results hold them directly, Grab per pharmacy)
                 total_items = 0
                 total_sold_out = 0
-                
                 for platform_result in results:
-                    if "pharmacies" in platform_result:
-                        for pharmacy in platform_result["pharmacies"]:
-                            if "items" in pharmacy:
-                                total_items += len(pharmacy["items"])
-                                total_sold_out += sum(
-                                    1 for item in pharmacy["items"]
-                                    if not item.get("is_available", True)
-                                )
-                    elif "items" in platform_result:
-                        total_items += len(platform_result["items"])
-                        total_sold_out += sum(
-                            1 for item in platform_result["items"]
-                            if not item.get("is_available", True)
-                        )
+                    for source in platform_result.get("pharmacies", [platform_result]):
+                        total_items += source.get("total_items_found", 0)
+                        total_sold_out += source.get("items_sold_out", 0)
                 
                 stockout_rate = (total_sold_out / total_items * 100) if total_items > 0 else 0
                 
@@ -239,16 +262,18 @@ async def main():
         debug=args.debug
     )
     
-    if args.once:
-        print("🔄 Running once...")
-        await scheduler.run_all_scrapers()
-        print("✅ Complete!")
-    else:
-        try:
-            await scheduler.start_scheduled_monitoring()
-        except KeyboardInterrupt:
-            scheduler.stop()
-            print("\n✅ Scheduler stopped by user")
+    # Keep the shared browser up between runs; it shuts down on exit
+    async with browser_pool:
+        if args.once:
+            print("🔄 Running once...")
+            await scheduler.run_all_scrapers()
+            print("✅ Complete!")
+        else:
+            try:
+                await scheduler.start_scheduled_monitoring()
+            except KeyboardInterrupt:
+                scheduler.stop()
+                print("\n✅ Scheduler stopped by user")
 
 
 if __name__ == "__main__":
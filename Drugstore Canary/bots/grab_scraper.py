@@ -4,16 +4,60 @@ Monitors medicine availability on Grab delivery app
 """
 import asyncio
 import json
+import re
 from datetime import datetime
+from functools import lru_cache
 from pathlib import Path
-from typing import List, Dict, Optional
+from typing import List, Dict, IO, Optional, Tuple
 import sys
 
-sys.path.append(str(Path(__file__).parent.parent))
+if __name__ == "__main__":
+    sys.path.append(str(Path(__file__).parent.parent))
 
 from bots.playwright_scraper import PlaywrightScraper
 
 
+# Text that marks a product as "sold out" or "unavailable"
+SOLD_OUT_INDICATORS = (
+    "sold out",
+    "out of stock",
+    "unavailable",
+    "หมด",
+    "ไม่มีสินค้า"
+)
+SOLD_OUT_RE = re.compile(
+    "|".join(re.escape(indicator) for indicator in SOLD_OUT_INDICATORS),
+    re.IGNORECASE
+)
+
+# Page selectors, built once and passed to Playwright as the same string
+LOCATION_INPUT_SELECTOR = "input[placeholder*='location'], input[placeholder*='address']"
+LOCATION_SUGGESTIONS_SELECTOR = "[role='listbox'], [role='option'], [class*='suggest'], [class*='autocomplete']"
+SEARCH_INPUT_SELECTOR = "input[placeholder*='search'], input[type='search']"
+
+# Containers rendered by a search (waited for as new elements, since the
+# landing page already has some of them)
+RESULTS_SELECTOR = "div[class*='product'], div[class*='item'], article"
+
+# Product card selectors in priority order (the first one that matches is
+# used for every card), and the card fields
+PRODUCT_SELECTORS = (
+    "div[class*='product']",
+    "div[class*='item']",
+    "div[class*='card']",
+    "article",
+)
+NAME_SELECTOR = "h3, h4, h5, p[class*='name'], span[class*='title']"
+PRICE_SELECTOR = "span[class*='price'], p[class*='price']"
+DISABLED_SELECTOR = "[disabled], [class*='disabled'], [class*='unavailable']"
+
+
+@lru_cache(maxsize=64)
+def _keyword_pattern(lowered_keywords: Tuple[str, ...]) -> "re.Pattern":
+    """Compile lowercased keywords into one alternation, cached per keyword set"""
+    return re.compile("|".join(re.escape(keyword) for keyword in lowered_keywords))
+
+
 class GrabScraper(PlaywrightScraper):
     """Scraper for Grab Mart pharmacy section"""
     
@@ -37,27 +81,24 @@ class GrabScraper(PlaywrightScraper):
             if self.debug:
                 print(f"\n🔍 Searching for {pharmacy_name} in {location}...")
             
-            # Navigate to Grab Mart
+            # Navigate to Grab Mart (waits for the page to settle)
             await self.navigate(self.base_url)
             
-            # Wait for page to load
-            await asyncio.sleep(3)
-            
-            # Look for location input
-            location_selector = "input[placeholder*='location'], input[placeholder*='address']"
-            if await self.wait_for_selector(location_selector, timeout=5000):
-                await self.type_text(location_selector, location)
-                await asyncio.sleep(2)
+            # Look for location input, then wait for its autocomplete
+            if await self.wait_for_selector(LOCATION_INPUT_SELECTOR, timeout=5000):
+                await self.mark_stale(LOCATION_SUGGESTIONS_SELECTOR)
+                await self.type_text(LOCATION_INPUT_SELECTOR, location)
+                await self.wait_for_fresh(LOCATION_SUGGESTIONS_SELECTOR, timeout=3000)
             
             # Look for search input
-            search_selector = "input[placeholder*='search'], input[type='search']"
-            if await self.wait_for_selector(search_selector, timeout=5000):
-                await self.type_text(search_selector, pharmacy_name)
-                await asyncio.sleep(2)
+            if await self.wait_for_selector(SEARCH_INPUT_SELECTOR, timeout=5000):
+                await self.type_text(SEARCH_INPUT_SELECTOR, pharmacy_name)
                 
-                # Press Enter or click search button
+                # Press Enter or click search button, then wait for the
+                # results this search renders
+                await self.mark_stale(RESULTS_SELECTOR)
                 await self.page.keyboard.press("Enter")
-                await asyncio.sleep(3)
+                await self.wait_for_fresh(RESULTS_SELECTOR, timeout=5000)
             
             # Take screenshot
             await self.take_screenshot(f"grab_{pharmacy_name}_{datetime.now().strftime('%Y%m%d_%H%M%S')}")
@@ -81,93 +122,74 @@ class GrabScraper(PlaywrightScraper):
         """
         items_found = []
         
+        # Lowercase once per scan rather than per product
+        lowered_keywords = tuple(keyword.lower() for keyword in item_keywords)
+        keyword_re = _keyword_pattern(lowered_keywords)
+        
         try:
             # Scroll to load all items
-            await self.scroll_to_bottom(pause_time=2)
+            await self.scroll_to_bottom()
             
-            # Get all product cards
-            product_selectors = [
-                "div[class*='product']",
-                "div[class*='item']",
-                "div[class*='card']",
-                "article",
-            ]
+            # Get all product cards in one in-page pass
+            extracted = await self.extract_products(
+                PRODUCT_SELECTORS,
+                name_selector=NAME_SELECTOR,
+                price_selector=PRICE_SELECTOR,
+                disabled_selector=DISABLED_SELECTOR,
+                limit=50
+            )
             
-            for selector in product_selectors:
-                products = await self.page.query_selector_all(selector)
-                
-                if products and len(products) > 0:
-                    if self.debug:
-                        print(f"✓ Found {len(products)} products with selector: {selector}")
+            if extracted["count"] > 0 and self.debug:
+                print(f"✓ Found {extracted['count']} products")
+            
+            # One timestamp for the whole extraction pass
+            timestamp = datetime.now().isoformat()
+            
+            for product in extracted["products"]:
+                try:
+                    # Get product name
+                    if product["name"] is None:
+                        continue
+                    
+                    product_name = product["name"]
+                    name_lower = product_name.lower()
+                    
+                    # One scan rejects the (usual) non-matching product
+                    if not lowered_keywords or keyword_re.search(name_lower) is None:
+                        continue
+                    
+                    # Check availability status
+                    is_available = SOLD_OUT_RE.search(product["text"]) is None
+                    
+                    # Check for disabled/grayed out elements
+                    if is_available and product["disabled"]:
+                        is_available = False
+                    
+                    # Get price if available
+                    price = product["price"]
+                    
+                    item_data = {
+                        "platform": "grab",
+                        "product_name": product_name,
+                        "is_available": is_available,
+                        "price": price,
+                        "timestamp": timestamp,
+                        "matched_keywords": [
+                            kw for kw, kw_lower in zip(item_keywords, lowered_keywords)
+                            if kw_lower in name_lower
+                        ]
+                    }
                     
-                    for product in products[:50]:  # Limit to first 50
-                        try:
-                            # Get product name
-                            name_element = await product.query_selector("h3, h4, h5, p[class*='name'], span[class*='title']")
-                            if not name_element:
-                                continue
-                            
-                            product_name = await name_element.text_content()
-                            product_name = product_name.strip() if product_name else ""
-                            
-                            # Check if any keyword matches
-                            matches_keyword = any(
-                                keyword.lower() in product_name.lower()
-                                for keyword in item_keywords
-                            )
-                            
-                            if not matches_keyword:
-                                continue
-                            
-                            # Check availability status
-                            is_available = True
-                            
-                            # Look for "sold out" or "unavailable" indicators
-                            sold_out_indicators = [
-                                "sold out",
-                                "out of stock",
-                                "unavailable",
-                                "หมด",
-                                "ไม่มีสินค้า"
-                            ]
-                            
-                            product_html = await product.inner_html()
-                            for indicator in sold_out_indicators:
-                                if indicator.lower() in product_html.lower():
-                                    is_available = False
-                                    break
-                            
-                            # Check for disabled/grayed out elements
-                            if is_available:
-                                disabled_element = await product.query_selector("[disabled], [class*='disabled'], [class*='unavailable']")
-                                if disabled_element:
-                                    is_available = False
-                            
-                            # Get price if available
-                            price_element = await product.query_selector("span[class*='price'], p[class*='price']")
-                            price = await price_element.text_content() if price_element else "N/A"
-                            
-                            item_data = {
-                                "platform": "grab",
-                                "product_name": product_name,
-                                "is_available": is_available,
-                                "price": price.strip() if price else "N/A",
-                                "timestamp": datetime.now().isoformat(),
-                                "matched_keywords": [kw for kw in item_keywords if kw.lower() in product_name.lower()]
-                            }
-                            
-                            items_found.append(item_data)
-                            
-                            if self.debug:
-                                status = "✅ Available" if is_available else "❌ Sold Out"
-                                print(f"  {status}: {product_name} - {price}")
-                        
-                        except Exception as e:
-                            if self.debug:
-                                print(f"  ⚠️ Error parsing product: {e}")
-                            continue
+                    items_found.append(item_data)
                     
-                    break  # Found products, no need to try other selectors
+                    if self.debug:
+                        status = "✅ Available" if is_available else "❌ Sold Out"
+                        print(f"  {status}: {product_name} - {price}")
+                
+                except Exception as e:
+                    if self.debug:
+                        print(f"  ⚠️ Error parsing product: {e}")
+                    continue
             
             if self.debug:
                 print(f"\n📊 Found {len(items_found)} matching items")
@@ -182,7 +204,8 @@ class GrabScraper(PlaywrightScraper):
         self,
         pharmacy_name: str,
         item_categories: Dict[str, List[str]],
-        location: str = "Hat Yai"
+        location: str = "Hat Yai",
+        writer: Optional[IO[str]] = None
     ) -> Dict:
         """
         Complete scraping workflow for a pharmacy
@@ -191,6 +214,8 @@ class GrabScraper(PlaywrightScraper):
             pharmacy_name: Pharmacy name
             item_categories: Dict of category -> keywords
             location: Location
+            writer: Open NDJSON file to stream items to instead of
+                collecting them in the result
             
         Returns:
             Scraping results
@@ -201,6 +226,9 @@ class GrabScraper(PlaywrightScraper):
             "platform": "grab",
             "timestamp": datetime.now().isoformat(),
             "items": [],
+            "total_items_found": 0,
+            "items_available": 0,
+            "items_sold_out": 0,
             "success": False
         }
         
@@ -222,12 +250,10 @@ class GrabScraper(PlaywrightScraper):
                 
                 for item in items:
                     item["category"] = category
-                    result["items"].append(item)
+                
+                self._record_items(result, items, writer)
             
             result["success"] = True
-            result["total_items_found"] = len(result["items"])
-            result["items_available"] = sum(1 for item in result["items"] if item["is_available"])
-            result["items_sold_out"] = sum(1 for item in result["items"] if not item["is_available"])
             
             if self.debug:
                 print(f"\n✅ Scraping complete:")
@@ -257,19 +283,19 @@ async def test_grab_scraper():
         if data["priority"] in ["high", "medium"]
     }
     
+    # Stream items to NDJSON as they are scraped
+    output_path = Path("grab_results.ndjson")
+    
     async with GrabScraper(headless=False, debug=True) as scraper:
-        result = await scraper.scrape_pharmacy_stock(
-            pharmacy_name="Boots",
-            item_categories=item_categories,
-            location="Hat Yai"
-        )
-        
-        # Save results
-        output_path = Path("grab_results.json")
-        with open(output_path, "w", encoding="utf-8") as f:
-            json.dump(result, f, indent=2, ensure_ascii=False)
+        with open(output_path, "w", encoding="utf-8", buffering=1 << 20) as writer:
+            result = await scraper.scrape_pharmacy_stock(
+                pharmacy_name="Boots",
+                item_categories=item_categories,
+                location="Hat Yai",
+                writer=writer
+            )
         
-        print(f"\n💾 Results saved to: {output_path}")
+        print(f"\n💾 {result['total_items_found']} items saved to: {output_path}")
 
 
 if __name__ == "__main__":
@@ -4,16 +4,46 @@ Monitors medicine availability on LINE MAN delivery app
 """
 import asyncio
 import json
+import re
 from datetime import datetime
 from pathlib import Path
-from typing import List, Dict
+from typing import List, Dict, IO, Optional, Set, Tuple
 import sys
 
-sys.path.append(str(Path(__file__).parent.parent))
+if __name__ == "__main__":
+    sys.path.append(str(Path(__file__).parent.parent))
 
 from bots.playwright_scraper import PlaywrightScraper
 
 
+# Text that marks a product as sold out
+SOLD_OUT_INDICATORS = ("หมด", "sold out", "unavailable")
+SOLD_OUT_RE = re.compile(
+    "|".join(re.escape(indicator) for indicator in SOLD_OUT_INDICATORS),
+    re.IGNORECASE
+)
+
+# Categories searched at once, each in its own tab
+MAX_CONCURRENT_CATEGORIES = 4
+
+# Pharmacy/health category links in priority order; one wait covers all of
+# them, and the click goes to the first that matches (a union selector would
+# click whichever comes first in the document, e.g. an ancestor div)
+PHARMACY_SELECTORS = (
+    "a[href*='pharmacy']",
+    "a[href*='health']",
+    "button:has-text('ร้านขายยา')",
+    "div:has-text('ร้านขายยา')"
+)
+PHARMACY_SELECTOR = ", ".join(PHARMACY_SELECTORS)
+SEARCH_INPUT_SELECTOR = "input[placeholder*='ค้นหา'], input[type='search']"
+
+# Product containers in the search results and their fields
+RESULTS_SELECTOR = "div[class*='product'], div[class*='item']"
+NAME_SELECTOR = "h3, h4, p[class*='name']"
+PRICE_SELECTOR = "span[class*='price']"
+
+
 class LinemanScraper(PlaywrightScraper):
     """Scraper for LINE MAN pharmacy section"""
     
@@ -28,22 +58,16 @@ class LinemanScraper(PlaywrightScraper):
             if self.debug:
                 print(f"\n🔍 Navigating to LINE MAN pharmacy...")
             
-            await self.navigate(self.base_url)
-            await asyncio.sleep(3)
-            
-            # Look for pharmacy/health category
-            pharmacy_selectors = [
-                "a[href*='pharmacy']",
-                "a[href*='health']",
-                "button:has-text('ร้านขายยา')",
-                "div:has-text('ร้านขายยา')"
-            ]
+            if not await self.navigate(self.base_url):
+                return False
             
-            for selector in pharmacy_selectors:
-                if await self.wait_for_selector(selector, timeout=3000):
-                    await self.click(selector)
-                    await asyncio.sleep(2)
-                    break
+            # Look for pharmacy/health category (one wait covers every variant)
+            if await self.wait_for_selector(PHARMACY_SELECTOR, timeout=3000):
+                for selector in PHARMACY_SELECTORS:
+                    if await self.page.query_selector(selector) is not None:
+                        await self.click(selector)
+                        await self.page.wait_for_load_state("domcontentloaded")
+                        break
             
             await self.take_screenshot(f"lineman_pharmacy_{datetime.now().strftime('%Y%m%d_%H%M%S')}")
             return True
@@ -57,27 +81,25 @@ class LinemanScraper(PlaywrightScraper):
         """Search for items and check availability"""
         items_found = []
         
+        # Popular products show up for several keywords; keep the first hit
+        seen: Set[Tuple[str, str]] = set()
+        
         try:
-            # Look for search box
-            search_selector = "input[placeholder*='ค้นหา'], input[type='search']"
-            
             for keyword in keywords[:5]:  # Limit searches
                 if self.debug:
                     print(f"\n🔍 Searching for: {keyword}")
                 
-                if await self.wait_for_selector(search_selector, timeout=5000):
-                    await self.type_text(search_selector, keyword)
-                    await asyncio.sleep(1)
+                if await self.wait_for_selector(SEARCH_INPUT_SELECTOR, timeout=5000):
+                    await self.type_text(SEARCH_INPUT_SELECTOR, keyword)
+                    
+                    # Wait for this keyword's results, not the previous ones
+                    await self.mark_stale(RESULTS_SELECTOR)
                     await self.page.keyboard.press("Enter")
-                    await asyncio.sleep(3)
+                    await self.wait_for_fresh(RESULTS_SELECTOR, timeout=5000)
                     
-                    # Check results
-                    items = await self._parse_search_results(keyword)
+                    # Check results (type_text clears the box for the next keyword)
+                    items = await self._parse_search_results(keyword, seen)
                     items_found.extend(items)
-                    
-                    # Clear search
-                    await self.page.fill(search_selector, "")
-                    await asyncio.sleep(1)
         
         except Exception as e:
             if self.debug:
@@ -85,44 +107,63 @@ class LinemanScraper(PlaywrightScraper):
         
         return items_found
     
-    async def _parse_search_results(self, keyword: str) -> List[Dict]:
-        """Parse search results for availability"""
+    async def _parse_search_results(
+        self,
+        keyword: str,
+        seen: Optional[Set[Tuple[str, str]]] = None
+    ) -> List[Dict]:
+        """
+        Parse search results for availability
+        
+        Args:
+            keyword: Keyword the results were searched for
+            seen: (product_name, price) pairs already collected; matching
+                products are skipped and new ones are added
+            
+        Returns:
+            Items found
+        """
         items = []
         
         try:
-            # Wait for results
-            await asyncio.sleep(2)
+            # Get product elements in one in-page pass
+            extracted = await self.extract_products(
+                RESULTS_SELECTOR,
+                name_selector=NAME_SELECTOR,
+                price_selector=PRICE_SELECTOR,
+                limit=20
+            )
             
-            # Get product elements
-            products = await self.page.query_selector_all("div[class*='product'], div[class*='item']")
+            # One timestamp for the whole extraction pass
+            timestamp = datetime.now().isoformat()
             
-            for product in products[:20]:
+            for product in extracted["products"]:
                 try:
                     # Get name
-                    name_elem = await product.query_selector("h3, h4, p[class*='name']")
-                    if not name_elem:
+                    if product["name"] is None:
                         continue
                     
-                    name = await name_elem.text_content()
-                    name = name.strip() if name else ""
+                    name = product["name"]
                     
-                    # Check availability
-                    is_available = True
-                    html = await product.inner_html()
+                    # Get price
+                    price = product["price"]
                     
-                    if any(x in html.lower() for x in ["หมด", "sold out", "unavailable"]):
-                        is_available = False
+                    # Skip products already found by an earlier keyword
+                    # (a set lookup, so it runs before the text scan)
+                    if seen is not None:
+                        if (name, price) in seen:
+                            continue
+                        seen.add((name, price))
                     
-                    # Get price
-                    price_elem = await product.query_selector("span[class*='price']")
-                    price = await price_elem.text_content() if price_elem else "N/A"
+                    # Check availability
+                    is_available = SOLD_OUT_RE.search(product["text"]) is None
                     
                     items.append({
                         "platform": "lineman",
                         "product_name": name,
                         "is_available": is_available,
-                        "price": price.strip() if price else "N/A",
-                        "timestamp": datetime.now().isoformat(),
+                        "price": price,
+                        "timestamp": timestamp,
                         "search_keyword": keyword
                     })
                     
@@ -141,40 +182,91 @@ class LinemanScraper(PlaywrightScraper):
         
         return items
     
+    async def _scrape_category(
+        self,
+        category: str,
+        keywords: List[str],
+        pharmacy_url: str,
+        semaphore: asyncio.Semaphore
+    ) -> Optional[List[Dict]]:
+        """
+        Search one category in its own tab
+        
+        Args:
+            category: Category name
+            keywords: Keywords to search for
+            pharmacy_url: Pharmacy section URL found by navigate_to_pharmacy()
+            semaphore: Limits how many tabs are open at once
+            
+        Returns:
+            Items found, tagged with the category, or None if the tab could
+            not open the pharmacy section
+        """
+        async with semaphore:
+            if self.debug:
+                print(f"\n📦 Category: {category}")
+            
+            tab = await self.open_tab()
+            try:
+                if not await tab.navigate(pharmacy_url):
+                    return None
+                items = await tab.search_items(keywords)
+            finally:
+                await tab.close_tab()
+        
+        for item in items:
+            item["category"] = category
+        
+        return items
+    
     async def scrape_pharmacy_stock(
         self,
         item_categories: Dict[str, List[str]],
-        location: str = "Hat Yai"
+        location: str = "Hat Yai",
+        writer: Optional[IO[str]] = None
     ) -> Dict:
-        """Complete scraping workflow"""
+        """Complete scraping workflow (streams items to writer as NDJSON if given)"""
         result = {
             "platform": "lineman",
             "location": location,
             "timestamp": datetime.now().isoformat(),
             "items": [],
+            "total_items_found": 0,
+            "items_available": 0,
+            "items_sold_out": 0,
             "success": False
         }
         
         try:
-            # Navigate to pharmacy
+            # Find the pharmacy section once; the tabs open it directly
             if not await self.navigate_to_pharmacy(location):
                 return result
+            pharmacy_url = self.page.url
             
-            # Search each category
-            for category, keywords in item_categories.items():
-                if self.debug:
-                    print(f"\n📦 Category: {category}")
-                
-                items = await self.search_items(keywords)
-                
-                for item in items:
-                    item["category"] = category
-                    result["items"].append(item)
+            # Search categories concurrently, one tab each
+            semaphore = asyncio.Semaphore(MAX_CONCURRENT_CATEGORIES)
+            category_results = await asyncio.gather(
+                *(
+                    self._scrape_category(category, keywords, pharmacy_url, semaphore)
+                    for category, keywords in item_categories.items()
+                ),
+                return_exceptions=True
+            )
+            
+            failed_categories = []
+            for category, items in zip(item_categories, category_results):
+                if isinstance(items, Exception) or items is None:
+                    if self.debug:
+                        print(f"❌ Category {category} error: {items or 'navigation failed'}")
+                    failed_categories.append(category)
+                    continue
+                self._record_items(result, items, writer)
+            
+            if item_categories and len(failed_categories) == len(item_categories):
+                result["error"] = "All categories failed"
+                return result
             
             result["success"] = True
-            result["total_items_found"] = len(result["items"])
-            result["items_available"] = sum(1 for item in result["items"] if item["is_available"])
-            result["items_sold_out"] = sum(1 for item in result["items"] if not item["is_available"])
             
             if self.debug:
                 print(f"\n✅ Complete: {result['total_items_found']} items found")
@@ -199,17 +291,17 @@ async def test_lineman_scraper():
         if data["priority"] == "high"
     }
     
+    output_path = Path("lineman_results.ndjson")
+    
     async with LinemanScraper(headless=False, debug=True) as scraper:
-        result = await scraper.scrape_pharmacy_stock(
-            item_categories=item_categories,
-            location="Hat Yai"
-        )
-        
-        output_path = Path("lineman_results.json")
-        with open(output_path, "w", encoding="utf-8") as f:
-            json.dump(result, f, indent=2, ensure_ascii=False)
+        with open(output_path, "w", encoding="utf-8", buffering=1 << 20) as writer:
+            result = await scraper.scrape_pharmacy_stock(
+                item_categories=item_categories,
+                location="Hat Yai",
+                writer=writer
+            )
         
-        print(f"\n💾 Results saved to: {output_path}")
+        print(f"\n💾 {result['total_items_found']} items saved to: {output_path}")
 
 
 if __name__ == "__main__":
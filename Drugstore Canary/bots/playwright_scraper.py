@@ -2,13 +2,15 @@
 Base Playwright scraper with anti-detection measures
 """
 import asyncio
+import copy
 import json
 from datetime import datetime
 from pathlib import Path
-from typing import Dict, List, Optional
+from typing import Dict, IO, List, Optional, Sequence, Union
 import sys
 
-sys.path.append(str(Path(__file__).parent.parent))
+if __name__ == "__main__":
+    sys.path.append(str(Path(__file__).parent.parent))
 
 try:
     from playwright.async_api import async_playwright, Page, Browser, BrowserContext
@@ -25,6 +27,154 @@ from bots.stealth_config import (
     SCREENSHOT_CONFIG
 )
 
+# In-page product extraction: walks the DOM and returns plain data, so
+# scraping a listing costs one round trip instead of several per product.
+# Card selectors are tried in priority order and the first one that matches
+# anything supplies every card. Installed once per page as
+# window.__extractProducts so each call reuses the already-compiled function
+# instead of shipping the source again.
+PRODUCT_EXTRACTOR_JS = """
+window.__extractProducts = ({selectors, nameSelector, priceSelector, disabledSelector, limit}) => {
+    let elements = [];
+    for (const selector of selectors) {
+        elements = document.querySelectorAll(selector);
+        if (elements.length > 0) {
+            break;
+        }
+    }
+    const products = [];
+    
+    for (let i = 0; i < elements.length && products.length < limit; i++) {
+        const element = elements[i];
+        
+        // Nameless cards are skipped by callers; don't read the rest of them
+        const nameElement = element.querySelector(nameSelector);
+        if (!nameElement) {
+            products.push({name: null});
+            continue;
+        }
+        
+        const priceElement = priceSelector ? element.querySelector(priceSelector) : null;
+        
+        products.push({
+            name: nameElement.textContent.trim(),
+            price: (priceElement && priceElement.textContent.trim()) || 'N/A',
+            text: element.textContent || '',
+            disabled: disabledSelector ? element.querySelector(disabledSelector) !== null : false,
+        });
+    }
+    
+    return {count: elements.length, products: products};
+};
+"""
+
+
+class PlaywrightPool:
+    """
+    Playwright driver and browsers shared by the scrapers in a process
+    
+    Each scraper acquires the pool on initialize() and releases it on
+    close(); the driver stops when the last user releases it. Hold the
+    pool with ``async with browser_pool:`` to keep the browsers up between
+    scraper runs, e.g. across scheduled runs.
+    """
+    
+    def __init__(self):
+        self._reset()
+    
+    def _reset(self):
+        """Forget all browsers and users"""
+        self._playwright = None
+        self._browsers: Dict[bool, Browser] = {}
+        self._users = 0
+        self._lock = asyncio.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+    
+    def _check_loop(self):
+        """Start over when used from a new event loop (e.g. a second asyncio.run)"""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # Handles bound to a finished loop cannot be closed from this one
+            self._reset()
+            self._loop = loop
+    
+    async def acquire(self, headless: bool = True) -> "Browser":
+        """
+        Register a user and get the shared browser, launching it on first use
+        
+        Args:
+            headless: Whether the browser runs headless (one browser per mode)
+            
+        Returns:
+            Connected Chromium browser; call release() when done with it
+        """
+        self._check_loop()
+        self._users += 1
+        
+        try:
+            async with self._lock:
+                browser = self._browsers.get(headless)
+                if browser is not None and browser.is_connected():
+                    return browser
+                
+                if self._playwright is None:
+                    self._playwright = await async_playwright().start()
+                
+                browser = await self._playwright.chromium.launch(
+                    headless=headless,
+                    args=[
+                        '--disable-blink-features=AutomationControlled',
+                        '--disable-dev-shm-usage',
+                        '--no-sandbox',
+                    ]
+                )
+                self._browsers[headless] = browser
+                return browser
+        except BaseException:
+            await self.release()
+            raise
+    
+    async def release(self):
+        """Unregister a user, closing the browsers when it was the last one"""
+        self._check_loop()
+        if self._users == 0:
+            return
+        
+        self._users -= 1
+        if self._users == 0:
+            await self._close()
+    
+    async def _close(self):
+        """Close all browsers and stop Playwright unless the pool is in use again"""
+        async with self._lock:
+            if self._users:
+                return
+            
+            for browser in self._browsers.values():
+                try:
+                    await browser.close()
+                except Exception as e:
+                    print(f"Browser close error: {e}")
+            self._browsers.clear()
+            
+            if self._playwright is not None:
+                await self._playwright.stop()
+                self._playwright = None
+    
+    async def __aenter__(self):
+        """Hold the pool open until exit"""
+        self._check_loop()
+        self._users += 1
+        return self
+    
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        """Release the hold taken on entry"""
+        await self.release()
+
+
+# Shared by every scraper in the process
+browser_pool = PlaywrightPool()
+
 
 class PlaywrightScraper:
     """Base class for Playwright-based web scrapers"""
@@ -46,17 +196,8 @@ class PlaywrightScraper:
         if async_playwright is None:
             raise ImportError("Playwright is required")
         
-        playwright = await async_playwright().start()
-        
-        # Launch browser
-        self.browser = await playwright.chromium.launch(
-            headless=self.headless,
-            args=[
-                '--disable-blink-features=AutomationControlled',
-                '--disable-dev-shm-usage',
-                '--no-sandbox',
-            ]
-        )
+        # Reuse the process-wide browser; each scraper gets its own context
+        self.browser = await browser_pool.acquire(self.headless)
         
         # Create context with stealth settings
         self.context = await self.browser.new_context(
@@ -75,22 +216,46 @@ class PlaywrightScraper:
             "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8",
         })
         
-        # Create page
-        self.page = await self.context.new_page()
-        
-        # Set timeouts
-        self.page.set_default_timeout(TIMING["page_load_timeout"])
-        self.page.set_default_navigation_timeout(TIMING["navigation_timeout"])
-        
-        # Inject anti-detection scripts
+        # Inject anti-detection scripts for every page in the context
         await self._inject_stealth_scripts()
         
+        # Create page
+        self.page = await self._new_page()
+        
         if self.debug:
             print(f"✓ Browser initialized with user agent: {self.stealth_config['user_agent'][:50]}...")
     
+    async def _new_page(self) -> "Page":
+        """Open a page in the shared context with default timeouts"""
+        page = await self.context.new_page()
+        page.set_default_timeout(TIMING["page_load_timeout"])
+        page.set_default_navigation_timeout(TIMING["navigation_timeout"])
+        return page
+    
+    async def open_tab(self) -> "PlaywrightScraper":
+        """
+        Open another tab that shares this scraper's browser context
+        
+        Returns:
+            Copy of this scraper driving the new page. Close it with
+            close_tab() rather than close(), which would close the shared
+            context and release the browser a second time.
+        """
+        tab = copy.copy(self)
+        tab.page = await self._new_page()
+        return tab
+    
+    async def close_tab(self):
+        """Close a page opened with open_tab()"""
+        try:
+            await self.page.close()
+        except Exception as e:
+            if self.debug:
+                print(f"Close tab error: {e}")
+    
     async def _inject_stealth_scripts(self):
         """Inject JavaScript to bypass bot detection"""
-        await self.page.add_init_script("""
+        await self.context.add_init_script("""
             // Override navigator.webdriver
             Object.defineProperty(navigator, 'webdriver', {
                 get: () => undefined
@@ -119,6 +284,9 @@ class PlaywrightScraper:
                     originalQuery(parameters)
             );
         """)
+        
+        # Product extractor shared by all listing scrapes
+        await self.context.add_init_script(PRODUCT_EXTRACTOR_JS)
     
     async def navigate(self, url: str, wait_until: str = "networkidle") -> bool:
         """
@@ -187,6 +355,50 @@ class PlaywrightScraper:
                 print(f"Selector not found: {selector} - {e}")
             return False
     
+    async def mark_stale(self, selector: str) -> None:
+        """
+        Tag the elements currently matching a selector as stale
+        
+        Call before an action that re-renders them, then wait_for_fresh()
+        waits for the action's own output rather than the old DOM.
+        
+        Args:
+            selector: CSS selector
+        """
+        try:
+            await self.page.evaluate(
+                "(selector) => document.querySelectorAll(selector)"
+                ".forEach((element) => element.setAttribute('data-canary-stale', ''))",
+                selector
+            )
+        except Exception as e:
+            if self.debug:
+                print(f"Mark stale error on {selector}: {e}")
+    
+    async def wait_for_fresh(self, selector: str, timeout: int = 10000) -> bool:
+        """
+        Wait for an element matching a selector that mark_stale() did not tag
+        
+        Args:
+            selector: CSS selector passed to mark_stale()
+            timeout: Timeout in milliseconds
+            
+        Returns:
+            True if a new element appeared, False otherwise
+        """
+        try:
+            await self.page.wait_for_function(
+                "(selector) => Array.from(document.querySelectorAll(selector))"
+                ".some((element) => !element.hasAttribute('data-canary-stale'))",
+                arg=selector,
+                timeout=timeout
+            )
+            return True
+        except Exception as e:
+            if self.debug:
+                print(f"No new elements for: {selector} - {e}")
+            return False
+    
     async def click(self, selector: str, delay: bool = True) -> bool:
         """
         Click element with human-like delay
@@ -258,6 +470,65 @@ class PlaywrightScraper:
                 print(f"Get attribute error on {selector}: {e}")
             return None
     
+    async def extract_products(
+        self,
+        selectors: Union[str, Sequence[str]],
+        name_selector: str,
+        price_selector: Optional[str] = None,
+        disabled_selector: Optional[str] = None,
+        limit: int = 50
+    ) -> Dict:
+        """
+        Extract product card data in a single page.evaluate call
+        
+        Args:
+            selectors: Product card selector, or alternatives in priority
+                order (the first that matches any element is used)
+            name_selector: Selector for the product name within a card
+            price_selector: Selector for the price within a card
+            disabled_selector: Selector marking a card as unavailable
+            limit: Maximum number of cards to extract
+            
+        Returns:
+            Dict with the matched card count and a list of products
+            (name and price trimmed, price "N/A" when missing; text; disabled).
+            Cards without a name element only carry name=None.
+        """
+        try:
+            return await self.page.evaluate("(args) => window.__extractProducts(args)", {
+                "selectors": [selectors] if isinstance(selectors, str) else list(selectors),
+                "nameSelector": name_selector,
+                "priceSelector": price_selector,
+                "disabledSelector": disabled_selector,
+                "limit": limit,
+            })
+        except Exception as e:
+            if self.debug:
+                print(f"Product extraction error: {e}")
+            return {"count": 0, "products": []}
+    
+    def _record_items(self, result: Dict, items: List[Dict], writer: Optional[IO[str]] = None):
+        """
+        Add scraped items to a result, keeping its counts up to date
+        
+        Args:
+            result: Result dict with items and running counters
+            items: Items to record
+            writer: Open text file; when given, items are streamed to it
+                as NDJSON lines instead of being held in result["items"]
+        """
+        for item in items:
+            if writer is not None:
+                writer.write(json.dumps(item, ensure_ascii=False, separators=(",", ":")) + "\n")
+            else:
+                result["items"].append(item)
+            
+            result["total_items_found"] += 1
+            if item["is_available"]:
+                result["items_available"] += 1
+            else:
+                result["items_sold_out"] += 1
+    
     async def take_screenshot(self, name: str) -> Optional[str]:
         """
         Take screenshot
@@ -285,51 +556,68 @@ class PlaywrightScraper:
                 print(f"Screenshot error: {e}")
             return None
     
-    async def scroll_to_bottom(self, pause_time: float = 1.0):
-        """Scroll to bottom of page with pauses"""
+    async def scroll_to_bottom(self, pause_time: float = 0.3, max_steps: int = 50):
+        """
+        Jump to the bottom of the page until its height stops growing
+        
+        Args:
+            pause_time: Seconds to wait for lazy-loaded content after each
+                jump before checking whether the page grew
+            max_steps: Upper bound on jumps for endlessly growing pages
+        """
         try:
             await self.page.evaluate("""
-                async () => {
+                async ([settleMs, maxSteps]) => {
                     await new Promise((resolve) => {
-                        let totalHeight = 0;
-                        const distance = 100;
-                        const timer = setInterval(() => {
-                            const scrollHeight = document.body.scrollHeight;
-                            window.scrollBy(0, distance);
-                            totalHeight += distance;
-                            
-                            if(totalHeight >= scrollHeight){
-                                clearInterval(timer);
+                        let lastHeight = -1;
+                        let steps = 0;
+                        const step = () => {
+                            const height = document.body.scrollHeight;
+                            if (height === lastHeight || steps++ >= maxSteps) {
                                 resolve();
+                                return;
                             }
-                        }, 100);
+                            lastHeight = height;
+                            window.scrollTo(0, height);
+                            requestAnimationFrame(() => setTimeout(step, settleMs));
+                        };
+                        step();
                     });
                 }
-            """)
-            await asyncio.sleep(pause_time)
+            """, [int(pause_time * 1000), max_steps])
         except Exception as e:
             if self.debug:
                 print(f"Scroll error: {e}")
     
     async def close(self):
-        """Close browser and clean up"""
+        """Close this scraper's context and release the shared browser"""
         try:
             if self.page:
                 await self.page.close()
             if self.context:
                 await self.context.close()
-            if self.browser:
-                await self.browser.close()
             
             if self.debug:
-                print("✓ Browser closed")
+                print("✓ Browser context closed")
         except Exception as e:
             if self.debug:
                 print(f"Close error: {e}")
+        finally:
+            self.page = None
+            self.context = None
+            
+            # The pool stops the browser once no scraper holds it
+            if self.browser is not None:
+                self.browser = None
+                await browser_pool.release()
     
     async def __aenter__(self):
         """Context manager entry"""
-        await self.initialize()
+        try:
+            await self.initialize()
+        except BaseException:
+            await self.close()
+            raise
         return self
     
     async def __aexit__(self, exc_type, exc_val, exc_tb):
@@ -3,12 +3,79 @@ Stock availability analyzer
 Analyzes stockout patterns from bot scraping results
 """
 import json
+from bisect import bisect_right
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
+from itertools import chain
 from pathlib import Path
-from typing import Dict, List, Tuple
+from typing import Dict, List, Optional, Tuple
 import pandas as pd
 import numpy as np
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+RESULT_FILE_PREFIX = "stock_check_"
+
+# Result files are read concurrently to overlap file I/O
+LOAD_WORKERS = 16
+
+# Anomaly score bin edges: below 1.5 is low, [1.5, 2.5) medium, and so on
+SEVERITY_BINS = (1.5, 2.5, 3.5)
+SEVERITY_LABELS = ("low", "medium", "high", "critical")
+
+
+def _is_result_timestamp(timestamp_str: str) -> bool:
+    """Check a filename timestamp has the YYYYMMDD_HHMMSS shape"""
+    return (
+        len(timestamp_str) == 15
+        and timestamp_str[8] == "_"
+        and timestamp_str[:8].isdigit()
+        and timestamp_str[9:].isdigit()
+    )
+
+
+def _platform_items(platform_result: Dict):
+    """
+    Get the scraped items of one platform result
+    
+    Args:
+        platform_result: Platform result, either with a list of
+            pharmacies (Grab) or with items directly (Lineman)
+        
+    Returns:
+        Iterable of item dicts, empty when nothing was scraped
+    """
+    pharmacies = platform_result.get("pharmacies")
+    if pharmacies is not None:
+        return chain.from_iterable(
+            pharmacy.get("items", ()) for pharmacy in pharmacies
+        )
+    return platform_result.get("items") or ()
+
+
+def _load_json(file_path: Path) -> Optional[List[Dict]]:
+    """Read one result file (orjson when available), None if unreadable"""
+    try:
+        data = file_path.read_bytes()
+        return orjson.loads(data) if orjson is not None else json.loads(data)
+    except Exception as e:
+        print(f"Error loading {file_path}: {e}")
+        return None
+
+
+def _dump_report(report: Dict) -> bytes:
+    """Serialize a report as indented UTF-8 JSON (orjson when available)"""
+    if orjson is not None:
+        return orjson.dumps(
+            report,
+            option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+        )
+    return json.dumps(report, indent=2, ensure_ascii=False).encode("utf-8")
+
 
 class StockAnalyzer:
     """Analyze stock availability data for anomaly detection"""
@@ -18,6 +85,9 @@ class StockAnalyzer:
             results_dir = Path(__file__).parent.parent / "bot_results"
         self.results_dir = Path(results_dir)
         self.results_dir.mkdir(exist_ok=True)
+        
+        # Parsed result files keyed by path, with the mtime they were read at
+        self._file_cache: Dict[Path, Tuple[int, List[Dict]]] = {}
     
     def load_results(self, days_back: int = 7) -> List[Dict]:
         """
@@ -29,23 +99,45 @@ class StockAnalyzer:
         Returns:
             List of result dictionaries
         """
-        results = []
         cutoff_date = datetime.now() - timedelta(days=days_back)
         
-        for file_path in self.results_dir.glob("stock_check_*.json"):
-            try:
-                # Extract timestamp from filename
-                timestamp_str = file_path.stem.replace("stock_check_", "")
-                file_date = datetime.strptime(timestamp_str, "%Y%m%d_%H%M%S")
-                
-                if file_date >= cutoff_date:
-                    with open(file_path, 'r', encoding='utf-8') as f:
-                        data = json.load(f)
-                        results.append(data)
+        # Filename timestamps sort lexically, so filter by string compare
+        cutoff_str = cutoff_date.strftime("%Y%m%d_%H%M%S")
+        paths = []
+        for file_path in self.results_dir.glob(f"{RESULT_FILE_PREFIX}*.json"):
+            timestamp_str = file_path.stem[len(RESULT_FILE_PREFIX):]
             
-            except Exception as e:
-                print(f"Error loading {file_path}: {e}")
+            if not _is_result_timestamp(timestamp_str):
+                print(f"Error loading {file_path}: unexpected timestamp '{timestamp_str}'")
                 continue
+            
+            if timestamp_str >= cutoff_str:
+                paths.append(file_path)
+        
+        # Only files that are new or changed since the last call are parsed
+        cached = {}
+        stale = []
+        for file_path in paths:
+            try:
+                mtime = file_path.stat().st_mtime_ns
+            except OSError:
+                continue
+            
+            entry = self._file_cache.get(file_path)
+            if entry is not None and entry[0] == mtime:
+                cached[file_path] = entry
+            else:
+                stale.append((file_path, mtime))
+        
+        if stale:
+            with ThreadPoolExecutor(max_workers=min(LOAD_WORKERS, len(stale))) as executor:
+                loaded = executor.map(_load_json, [file_path for file_path, _ in stale])
+                for (file_path, mtime), data in zip(stale, loaded):
+                    if data is not None:
+                        cached[file_path] = (mtime, data)
+        
+        self._file_cache = cached
+        results = [data for _, data in cached.values()]
         
         return sorted(results, key=lambda x: x[0].get("timestamp", ""))
     
@@ -53,7 +145,8 @@ class StockAnalyzer:
         self,
         results: List[Dict],
         category: str = None,
-        platform: str = None
+        platform: str = None,
+        items: Optional[pd.DataFrame] = None
     ) -> Dict:
         """
         Calculate stockout rate from results
@@ -62,86 +155,98 @@ class StockAnalyzer:
             results: List of scraping results
             category: Optional category filter
             platform: Optional platform filter
+            items: Items already flattened from results with
+                _flatten_items, to reuse across several calls
             
         Returns:
             Dictionary with stockout statistics
         """
-        total_checks = 0
-        total_sold_out = 0
-        item_stats = {}
+        df = self._flatten_items(results) if items is None else items
         
-        for result_set in results:
-            for platform_result in result_set:
-                # Filter by platform if specified
-                if platform and platform_result.get("platform") != platform:
-                    continue
-                
-                # Extract items from different result structures
-                items = []
-                if "pharmacies" in platform_result:
-                    for pharmacy in platform_result["pharmacies"]:
-                        if "items" in pharmacy:
-                            items.extend(pharmacy["items"])
-                elif "items" in platform_result:
-                    items = platform_result["items"]
-                
-                # Process items
-                for item in items:
-                    # Filter by category if specified
-                    if category and item.get("category") != category:
-                        continue
-                    
-                    total_checks += 1
-                    
-                    if not item.get("is_available", True):
-                        total_sold_out += 1
-                    
-                    # Track per-item stats
-                    item_name = item.get("product_name", "Unknown")
-                    if item_name not in item_stats:
-                        item_stats[item_name] = {
-                            "total_checks": 0,
-                            "sold_out_count": 0,
-                            "category": item.get("category", "Unknown"),
-                            "platform": item.get("platform", "Unknown")
-                        }
-                    
-                    item_stats[item_name]["total_checks"] += 1
-                    if not item.get("is_available", True):
-                        item_stats[item_name]["sold_out_count"] += 1
+        # Apply optional filters with boolean masks
+        if platform:
+            df = df[df["result_platform"] == platform]
+        if category:
+            df = df[df["category"] == category]
+        
+        total_checks = len(df)
+        total_sold_out = int((~df["is_available"]).sum())
         
         # Calculate rates
         overall_rate = (total_sold_out / total_checks * 100) if total_checks > 0 else 0
         
-        # Calculate per-item rates
-        for item_name, stats in item_stats.items():
-            stats["stockout_rate"] = (
-                stats["sold_out_count"] / stats["total_checks"] * 100
-                if stats["total_checks"] > 0 else 0
+        # Per-item stats (category/platform from each item's first check)
+        high_risk_items = []
+        if total_checks > 0:
+            item_stats = df.assign(sold_out=~df["is_available"]).groupby(
+                "product_name", sort=False
+            ).agg(
+                total_checks=("sold_out", "size"),
+                sold_out_count=("sold_out", "sum"),
+                category=("item_category", "first"),
+                platform=("platform", "first"),
             )
-        
-        # Sort items by stockout rate
-        high_risk_items = sorted(
-            item_stats.items(),
-            key=lambda x: x[1]["stockout_rate"],
-            reverse=True
-        )[:10]  # Top 10
+            item_stats["stockout_rate"] = (
+                item_stats["sold_out_count"] / item_stats["total_checks"] * 100
+            )
+            
+            # Top 10 by partial selection, ties kept in first-seen order
+            top = item_stats.nlargest(10, "stockout_rate", keep="first")
+            
+            high_risk_items = [
+                {
+                    "item_name": name,
+                    "total_checks": int(row.total_checks),
+                    "sold_out_count": int(row.sold_out_count),
+                    "category": row.category,
+                    "platform": row.platform,
+                    "stockout_rate": float(row.stockout_rate)
+                }
+                for name, row in zip(top.index, top.itertuples(index=False))
+            ]
         
         return {
             "total_checks": total_checks,
             "total_sold_out": total_sold_out,
             "overall_stockout_rate": overall_rate,
-            "high_risk_items": [
-                {
-                    "item_name": name,
-                    **stats
-                }
-                for name, stats in high_risk_items
-            ],
+            "high_risk_items": high_risk_items,
             "category_filter": category,
             "platform_filter": platform
         }
     
+    def _flatten_items(self, results: List[Dict]) -> pd.DataFrame:
+        """
+        Flatten every scraped item into one row
+        
+        Args:
+            results: List of scraping results
+            
+        Returns:
+            DataFrame with result_platform, product_name, category
+            (raw, for filtering), item_category, platform and is_available
+        """
+        rows = [
+            (
+                platform_result.get("platform"),
+                item.get("product_name", "Unknown"),
+                item.get("category"),
+                item.get("category", "Unknown"),
+                item.get("platform", "Unknown"),
+                bool(item.get("is_available", True))
+            )
+            for result_set in results
+            for platform_result in result_set
+            for item in _platform_items(platform_result)
+        ]
+        
+        return pd.DataFrame(
+            rows,
+            columns=[
+                "result_platform", "product_name", "category",
+                "item_category", "platform", "is_available"
+            ]
+        ).astype({"is_available": bool})
+    
     def detect_anomalies(
         self,
         results: List[Dict],
@@ -163,86 +268,111 @@ class StockAnalyzer:
         if df.empty:
             return []
         
-        anomalies = []
+        # Per-category baseline and spread from a single grouped aggregation
+        # (pandas' grouped variance is a one-pass Welford kernel), then
+        # broadcast back onto every row through the category codes.
+        # Codes follow first-seen order; rows with no category get -1 and
+        # never count as anomalous.
+        rates = df["stockout_rate"].to_numpy(dtype=float)
+        codes, _ = pd.factorize(df["category"])
+        has_category = codes >= 0
         
-        # Group by category
-        for category in df["category"].unique():
-            category_df = df[df["category"] == category]
-            
-            # Calculate baseline stockout rate
-            baseline_rate = category_df["stockout_rate"].mean()
-            std_dev = category_df["stockout_rate"].std()
-            
-            # Detect anomalies
-            threshold = baseline_rate + (threshold_std * std_dev)
-            
-            anomalous_points = category_df[category_df["stockout_rate"] > threshold]
-            
-            for _, row in anomalous_points.iterrows():
-                anomalies.append({
-                    "timestamp": row["timestamp"],
-                    "category": category,
-                    "stockout_rate": row["stockout_rate"],
-                    "baseline_rate": baseline_rate,
-                    "threshold": threshold,
-                    "anomaly_score": (row["stockout_rate"] - baseline_rate) / (std_dev + 1e-8),
-                    "severity": self._classify_severity(
-                        (row["stockout_rate"] - baseline_rate) / (std_dev + 1e-8)
-                    )
-                })
-        
-        return sorted(anomalies, key=lambda x: x["anomaly_score"], reverse=True)
+        stats = pd.Series(rates[has_category]).groupby(codes[has_category]).agg(["mean", "std"])
+        baseline = np.full(len(rates), np.nan)
+        std_dev = np.full(len(rates), np.nan)
+        baseline[has_category] = stats["mean"].to_numpy()[codes[has_category]]
+        std_dev[has_category] = stats["std"].to_numpy()[codes[has_category]]
+        threshold = baseline + (threshold_std * std_dev)
+        
+        # Detect anomalies
+        mask = rates > threshold
+        if not mask.any():
+            return []
+        
+        anomaly_score = (rates[mask] - baseline[mask]) / (std_dev[mask] + 1e-8)
+        anomalies = pd.DataFrame({
+            "timestamp": df["timestamp"].to_numpy()[mask],
+            "category": df["category"].to_numpy()[mask],
+            "stockout_rate": rates[mask],
+            "baseline_rate": baseline[mask],
+            "threshold": threshold[mask],
+            "anomaly_score": anomaly_score,
+            "severity": pd.cut(
+                anomaly_score,
+                bins=[-np.inf, *SEVERITY_BINS, np.inf],
+                labels=list(SEVERITY_LABELS),
+                right=False
+            ).astype(str),
+            # Keeps ties in category first-seen order
+            "category_rank": codes[mask],
+        })
+        
+        anomalies = anomalies.sort_values(
+            ["anomaly_score", "category_rank"],
+            ascending=[False, True],
+            kind="stable"
+        ).drop(columns="category_rank")
+        
+        return anomalies.to_dict("records")
     
     def _results_to_dataframe(self, results: List[Dict]) -> pd.DataFrame:
-        """Convert results to pandas DataFrame"""
-        rows = []
+        """Convert results to pandas DataFrame (one row per platform result and category)"""
+        # Gather items column-wise, tagging each with the platform result it
+        # came from so the grouping matches one row set per platform result
+        sources = []
+        timestamps = []
+        platforms = []
+        categories = []
+        available = []
+        source_id = 0
+        fallback_timestamp = None
         
         for result_set in results:
-            timestamp = result_set[0].get("timestamp", datetime.now().isoformat())
+            timestamp = result_set[0].get("timestamp")
+            if timestamp is None:
+                if fallback_timestamp is None:
+                    fallback_timestamp = datetime.now().isoformat()
+                timestamp = fallback_timestamp
             
             for platform_result in result_set:
-                items = []
-                if "pharmacies" in platform_result:
-                    for pharmacy in platform_result["pharmacies"]:
-                        if "items" in pharmacy:
-                            items.extend(pharmacy["items"])
-                elif "items" in platform_result:
-                    items = platform_result["items"]
+                items = list(_platform_items(platform_result))
                 
-                # Group by category
-                category_stats = {}
-                for item in items:
-                    category = item.get("category", "Unknown")
-                    if category not in category_stats:
-                        category_stats[category] = {"total": 0, "sold_out": 0}
-                    
-                    category_stats[category]["total"] += 1
-                    if not item.get("is_available", True):
-                        category_stats[category]["sold_out"] += 1
+                if not items:
+                    continue
                 
-                # Create rows
-                for category, stats in category_stats.items():
-                    rows.append({
-                        "timestamp": timestamp,
-                        "category": category,
-                        "platform": platform_result.get("platform", "Unknown"),
-                        "total_items": stats["total"],
-                        "sold_out": stats["sold_out"],
-                        "stockout_rate": (stats["sold_out"] / stats["total"] * 100) if stats["total"] > 0 else 0
-                    })
-        
-        return pd.DataFrame(rows)
+                count = len(items)
+                sources.extend([source_id] * count)
+                source_id += 1
+                timestamps.extend([timestamp] * count)
+                platforms.extend([platform_result.get("platform", "Unknown")] * count)
+                categories.extend([item.get("category", "Unknown") for item in items])
+                available.extend([bool(item.get("is_available", True)) for item in items])
+        
+        if not sources:
+            return pd.DataFrame()
+        
+        items_df = pd.DataFrame({
+            "source": sources,
+            "timestamp": timestamps,
+            "category": categories,
+            "platform": platforms,
+            "sold_out": ~np.array(available, dtype=bool),
+        })
+        
+        df = items_df.groupby(["source", "category"], sort=False, dropna=False).agg(
+            timestamp=("timestamp", "first"),
+            platform=("platform", "first"),
+            total_items=("sold_out", "size"),
+            sold_out=("sold_out", "sum"),
+        ).reset_index().drop(columns="source")
+        
+        df["stockout_rate"] = df["sold_out"] / df["total_items"] * 100
+        
+        return df[["timestamp", "category", "platform", "total_items", "sold_out", "stockout_rate"]]
     
     def _classify_severity(self, anomaly_score: float) -> str:
         """Classify anomaly severity"""
-        if anomaly_score < 1.5:
-            return "low"
-        elif anomaly_score < 2.5:
-            return "medium"
-        elif anomaly_score < 3.5:
-            return "high"
-        else:
-            return "critical"
+        return SEVERITY_LABELS[bisect_right(SEVERITY_BINS, anomaly_score)]
     
     def generate_report(self, days_back: int = 7) -> Dict:
         """
@@ -262,15 +392,19 @@ class StockAnalyzer:
                 "days_back": days_back
             }
         
+        # Flatten items once for the overall and per-category statistics
+        items = self._flatten_items(results)
+        
         # Overall statistics
-        overall_stats = self.calculate_stockout_rate(results)
+        overall_stats = self.calculate_stockout_rate(results, items=items)
         
         # Per-category statistics
         category_stats = {}
         for category in ["diarrhea", "skin_infection", "fever", "respiratory"]:
             category_stats[category] = self.calculate_stockout_rate(
                 results,
-                category=category
+                category=category,
+                items=items
             )
         
         # Anomaly detection
@@ -291,9 +425,8 @@ class StockAnalyzer:
     def _determine_alert_level(self, overall_stats: Dict, anomalies: List[Dict]) -> str:
         """Determine overall alert level"""
         stockout_rate = overall_stats["overall_stockout_rate"]
-        critical_anomalies = sum(1 for a in anomalies if a["severity"] == "critical")
         
-        if stockout_rate > 50 or critical_anomalies > 0:
+        if stockout_rate > 50 or any(a["severity"] == "critical" for a in anomalies):
             return "critical"
         elif stockout_rate > 30 or len(anomalies) > 2:
             return "high"
@@ -337,7 +470,6 @@ if __name__ == "__main__":
     
     # Save report
     report_path = Path("stock_analysis_report.json")
-    with open(report_path, 'w', encoding='utf-8') as f:
-        json.dump(report, f, indent=2, ensure_ascii=False)
+    report_path.write_bytes(_dump_report(report))
     
     print(f"\n💾 Full report saved to: {report_path}")
@@ -4,13 +4,16 @@ Generates realistic pharmacy sales data with outbreak scenarios
 """
 import numpy as np
 import pandas as pd
+from functools import lru_cache
+from sqlalchemy import insert
 from datetime import datetime, timedelta
-from typing import Dict, List
+from typing import Dict, List, Optional, Tuple
 import sys
 from pathlib import Path
 
 # Add parent directory to path
-sys.path.append(str(Path(__file__).parent.parent))
+if __name__ == "__main__":
+    sys.path.append(str(Path(__file__).parent.parent))
 
 from config import (
     HAT_YAI_ZONES, 
@@ -23,36 +26,105 @@ from data.database import (
 )
 
 
+# Sales rows accumulated across pharmacies before each bulk insert
+SALES_INSERT_BATCH_SIZE = 10_000
+
+
+@lru_cache(maxsize=None)
+def _seasonal_factors(num_days: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Build the weekly and monthly sales multipliers shared by every category
+    
+    Args:
+        num_days: Number of days
+        
+    Returns:
+        Read-only (weekly, monthly) daily multipliers
+    """
+    t = np.arange(num_days)
+    
+    weekly = np.sin(2 * np.pi * t / 7)
+    weekly *= 0.2
+    weekly += 1
+    
+    monthly = np.sin(2 * np.pi * t / 30)
+    monthly *= 0.1
+    monthly += 1
+    
+    weekly.flags.writeable = False
+    monthly.flags.writeable = False
+    return weekly, monthly
+
+
 class SyntheticDataGenerator:
     """Generate synthetic pharmacy sales data with realistic patterns"""
     
-    def __init__(self, config: Dict = None):
+    def __init__(self, config: Dict = None, seed: Optional[int] = None):
         self.config = config or SYNTHETIC_DATA_CONFIG
         self.start_date = datetime.strptime(self.config["start_date"], "%Y-%m-%d")
         self.num_days = self.config["num_days"]
         self.base_sales = self.config["base_daily_sales"]
         self.noise_level = self.config["noise_level"]
         
-    def generate_base_pattern(self, category: str, num_days: int) -> np.ndarray:
-        """Generate base sales pattern with weekly seasonality"""
-        base_value = self.base_sales.get(category, 15)
+        # Single random stream for all generated data (pass a seed to reproduce)
+        self.rng = np.random.default_rng(seed)
         
-        # Create time series
-        t = np.arange(num_days)
+        # Noise-free seasonal patterns keyed by (category, num_days)
+        self._base_trends: Dict[tuple, np.ndarray] = {}
         
-        # Weekly pattern (higher sales on weekends)
-        weekly_pattern = 1 + 0.2 * np.sin(2 * np.pi * t / 7)
+    def _base_trend(self, category: str, num_days: int) -> np.ndarray:
+        """
+        Get the noise-free seasonal sales pattern of a category
+        
+        Args:
+            category: Medicine category
+            num_days: Number of days
+            
+        Returns:
+            Cached daily base sales (shared, do not modify in place)
+        """
+        key = (category, num_days)
+        trend = self._base_trends.get(key)
+        if trend is not None:
+            return trend
         
-        # Monthly pattern (slight increase mid-month)
-        monthly_pattern = 1 + 0.1 * np.sin(2 * np.pi * t / 30)
+        weekly, monthly = _seasonal_factors(num_days)
+        
+        # Higher sales on weekends, slight increase mid-month
+        trend = weekly * self.base_sales.get(category, 15)
+        trend *= monthly
+        
+        self._base_trends[key] = trend
+        return trend
+    
+    def generate_base_pattern(
+        self,
+        category: str,
+        num_days: int,
+        noise: Optional[np.ndarray] = None
+    ) -> np.ndarray:
+        """
+        Generate base sales pattern with weekly seasonality
         
+        Args:
+            category: Medicine category
+            num_days: Number of days
+            noise: Pre-drawn relative noise for each day; drawn from
+                self.rng when not given
+            
+        Returns:
+            Daily sales values
+        """
         # Random noise
-        noise = 1 + np.random.normal(0, self.noise_level, num_days)
+        if noise is None:
+            noise = self.rng.normal(0, self.noise_level, num_days)
         
-        # Combine patterns
-        sales = base_value * weekly_pattern * monthly_pattern * noise
+        # Seasonality is the same for every pharmacy, so only the noise
+        # factor is built per call and scaled by the cached trend
+        sales = 1 + noise
+        sales *= self._base_trend(category, num_days)
         
-        return np.maximum(sales, 0)  # Ensure non-negative
+        return np.maximum(sales, 0, out=sales)  # Ensure non-negative
     
     def inject_outbreak(self, sales: np.ndarray, outbreak: Dict) -> np.ndarray:
         """Inject outbreak pattern into sales data"""
@@ -63,12 +135,11 @@ class SyntheticDataGenerator:
         # Create gradual increase and decrease
         outbreak_pattern = np.zeros(len(sales))
         
-        # Ramp up (3 days)
+        # Ramp up (3 days), slices stop at the end of the series
         ramp_up_days = min(3, duration // 3)
-        for i in range(ramp_up_days):
-            day_idx = start_day + i
-            if day_idx < len(sales):
-                outbreak_pattern[day_idx] = multiplier * (i + 1) / ramp_up_days
+        ramp = multiplier * np.arange(1, ramp_up_days + 1) / ramp_up_days
+        window = outbreak_pattern[start_day:start_day + ramp_up_days]
+        window[:] = ramp[:len(window)]
         
         # Peak period
         peak_start = start_day + ramp_up_days
@@ -76,20 +147,41 @@ class SyntheticDataGenerator:
         outbreak_pattern[peak_start:peak_end] = multiplier
         
         # Ramp down
-        for i in range(ramp_up_days):
-            day_idx = peak_end + i
-            if day_idx < len(sales):
-                outbreak_pattern[day_idx] = multiplier * (ramp_up_days - i) / ramp_up_days
+        window = outbreak_pattern[peak_end:peak_end + ramp_up_days]
+        window[:] = ramp[::-1][:len(window)]
         
-        return sales * (1 + outbreak_pattern)
+        # Scale into the pattern buffer instead of allocating two new arrays
+        outbreak_pattern += 1
+        outbreak_pattern *= sales
+        return outbreak_pattern
     
-    def generate_pharmacy_sales(self, pharmacy_id: str, zone_id: str) -> pd.DataFrame:
-        """Generate sales data for a single pharmacy"""
+    def generate_pharmacy_sales(
+        self,
+        pharmacy_id: str,
+        zone_id: str,
+        noise: Optional[np.ndarray] = None
+    ) -> pd.DataFrame:
+        """
+        Generate sales data for a single pharmacy
+        
+        Args:
+            pharmacy_id: Pharmacy identifier
+            zone_id: Zone the pharmacy is in
+            noise: Pre-drawn noise, one row per category (in
+                MEDICINE_CATEGORIES order) of num_days values
+            
+        Returns:
+            DataFrame with one row per category and day
+        """
         data = []
         
-        for category, medicines in MEDICINE_CATEGORIES.items():
+        for category_idx, category in enumerate(MEDICINE_CATEGORIES):
             # Generate base pattern
-            sales = self.generate_base_pattern(category, self.num_days)
+            sales = self.generate_base_pattern(
+                category,
+                self.num_days,
+                None if noise is None else noise[category_idx]
+            )
             
             # Apply outbreak scenarios
             for outbreak in self.config["outbreak_scenarios"]:
@@ -113,25 +205,34 @@ class SyntheticDataGenerator:
     
     def generate_flood_events(self) -> List[Dict]:
         """Generate synthetic flood event data"""
-        flood_events = []
+        outbreaks = self.config["outbreak_scenarios"]
         
-        # Simulate flood events that correlate with outbreak scenarios
-        for outbreak in self.config["outbreak_scenarios"]:
-            # Flood occurs 3-5 days before outbreak
-            flood_start = outbreak["start_day"] - np.random.randint(3, 6)
-            
-            for zone_id in outbreak["affected_zones"]:
-                flood_date = self.start_date + timedelta(days=flood_start)
-                
-                flood_events.append({
-                    "zone_id": zone_id,
-                    "date": flood_date,
-                    "water_level_cm": np.random.uniform(30, 100),
-                    "duration_hours": np.random.uniform(12, 48),
-                    "severity": np.random.choice(["medium", "high"], p=[0.6, 0.4])
-                })
+        # Simulate flood events that correlate with outbreak scenarios:
+        # flood occurs 3-5 days before outbreak, in each affected zone
+        lead_days = self.rng.integers(3, 6, size=len(outbreaks))
+        flood_zones = [
+            (zone_id, outbreak["start_day"] - int(lead))
+            for outbreak, lead in zip(outbreaks, lead_days)
+            for zone_id in outbreak["affected_zones"]
+        ]
+        
+        # Draw every event's measurements at once
+        num_events = len(flood_zones)
+        water_levels = self.rng.uniform(30, 100, size=num_events)
+        durations = self.rng.uniform(12, 48, size=num_events)
+        severities = self.rng.choice(["medium", "high"], size=num_events, p=[0.6, 0.4])
         
-        return flood_events
+        return [
+            {
+                "zone_id": zone_id,
+                "date": self.start_date + timedelta(days=flood_start),
+                "water_level_cm": float(water_level),
+                "duration_hours": float(duration),
+                "severity": str(severity)
+            }
+            for (zone_id, flood_start), water_level, duration, severity
+            in zip(flood_zones, water_levels, durations, severities)
+        ]
     
     def populate_database(self):
         """Populate database with synthetic data"""
@@ -173,8 +274,8 @@ class SyntheticDataGenerator:
             for zone_id, zone_data in HAT_YAI_ZONES.items():
                 for pharmacy_id in zone_data["pharmacies"]:
                     # Random location near zone center
-                    lat_offset = np.random.uniform(-0.01, 0.01)
-                    lon_offset = np.random.uniform(-0.01, 0.01)
+                    lat_offset = self.rng.uniform(-0.01, 0.01)
+                    lon_offset = self.rng.uniform(-0.01, 0.01)
                     
                     pharmacy = Pharmacy(
                         id=pharmacy_id,
@@ -187,30 +288,42 @@ class SyntheticDataGenerator:
                     all_pharmacies.append((pharmacy_id, zone_id))
             session.commit()
             
+            # Sales are recorded against the first medicine in each category
+            category_medicine_ids = {
+                category: medicine_map.get(f"{category}_{medicines[0]}")
+                for category, medicines in MEDICINE_CATEGORIES.items()
+            }
+            
+            # Draw noise for every pharmacy, category and day in one shot
+            noise = self.rng.normal(
+                0,
+                self.noise_level,
+                size=(len(all_pharmacies), len(MEDICINE_CATEGORIES), self.num_days)
+            )
+            
             # Generate sales data
             print(f"Generating sales data for {len(all_pharmacies)} pharmacies...")
-            for pharmacy_id, zone_id in all_pharmacies:
+            pending_sales = []
+            for pharmacy_idx, (pharmacy_id, zone_id) in enumerate(all_pharmacies):
                 print(f"  Processing {pharmacy_id}...")
-                df = self.generate_pharmacy_sales(pharmacy_id, zone_id)
+                df = self.generate_pharmacy_sales(pharmacy_id, zone_id, noise[pharmacy_idx])
                 
-                # Insert sales records
-                for _, row in df.iterrows():
-                    # Get medicine_id for first medicine in category
-                    category = row["category"]
-                    first_medicine = MEDICINE_CATEGORIES[category][0]
-                    medicine_id = medicine_map.get(f"{category}_{first_medicine}")
-                    
-                    if medicine_id:
-                        sale = PharmacySales(
-                            pharmacy_id=row["pharmacy_id"],
-                            medicine_id=medicine_id,
-                            date=row["date"],
-                            quantity_sold=row["quantity_sold"]
-                        )
-                        session.add(sale)
+                # Map categories to medicine ids in one vectorized pass
+                df["medicine_id"] = df["category"].map(category_medicine_ids)
+                df = df[df["medicine_id"].notna()].astype({"medicine_id": int})
+                pending_sales.extend(
+                    df[["pharmacy_id", "medicine_id", "date", "quantity_sold"]].to_dict("records")
+                )
                 
-                # Commit in batches
-                session.commit()
+                # Bulk insert in large batches without building ORM instances
+                if len(pending_sales) >= SALES_INSERT_BATCH_SIZE:
+                    session.execute(insert(PharmacySales), pending_sales)
+                    pending_sales = []
+            
+            if pending_sales:
+                session.execute(insert(PharmacySales), pending_sales)
+            
+            session.commit()
             
             # Generate flood events
             print("Generating flood events...")
@@ -2,7 +2,7 @@
 Database models and connection management for Drugstore Canary
 """
 from datetime import datetime
-from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime, ForeignKey, Boolean
+from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime, ForeignKey, Boolean, Index
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, relationship
 from config import DATABASE_URL, BASE_DIR
@@ -94,6 +94,19 @@ class Alert(Base):
     resolved_at = Column(DateTime)
     
     zone = relationship("Zone", back_populates="alerts")
+    
+    # Equality-filtered columns first, range/sort column last
+    __table_args__ = (
+        # Newest-first so cooldown lookups stop at the first match;
+        # INCLUDE makes it covering on PostgreSQL (ignored elsewhere)
+        Index(
+            "ix_alert_cooldown",
+            "zone_id", "medicine_category", detected_at.desc(),
+            postgresql_include=["id"]
+        ),
+        Index("ix_alert_active_detected", "is_active", "detected_at"),
+        Index("ix_alert_active_zone", "is_active", "zone_id"),
+    )
 
 
 class ModelPrediction(Base):
@@ -111,6 +124,11 @@ class ModelPrediction(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
 
 
+# Shared engine and session factory (connections are pooled across sessions)
+engine = create_engine(DATABASE_URL, echo=False, pool_pre_ping=True)
+SessionLocal = sessionmaker(bind=engine)
+
+
 # Database initialization
 def init_db():
     """Initialize database and create all tables"""
@@ -118,16 +136,24 @@ def init_db():
     data_dir = BASE_DIR / "data"
     data_dir.mkdir(exist_ok=True)
     
-    engine = create_engine(DATABASE_URL, echo=False)
     Base.metadata.create_all(engine)
     return engine
 
 
 def get_session():
     """Get database session"""
-    engine = create_engine(DATABASE_URL, echo=False)
-    Session = sessionmaker(bind=engine)
-    return Session()
+    return SessionLocal()
+
+
+def get_db():
+    """Yield a database session for FastAPI dependencies"""
+    # Objects loaded before a handler commits stay usable afterwards without
+    # a re-SELECT; scripts using get_session() keep the default expiry
+    session = SessionLocal(expire_on_commit=False)
+    try:
+        yield session
+    finally:
+        session.close()
 
 
 if __name__ == "__main__":
@@ -4,22 +4,90 @@ Prepares sales data for anomaly detection models
 """
 import pandas as pd
 import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
 from datetime import datetime, timedelta
-from typing import Dict, List, Tuple
+from functools import lru_cache
+from itertools import product
+from typing import Dict, List, Optional, Tuple
 import sys
 from pathlib import Path
 
-sys.path.append(str(Path(__file__).parent.parent))
+if __name__ == "__main__":
+    sys.path.append(str(Path(__file__).parent.parent))
+
+from sqlalchemy import func
+
+try:
+    import numba
+except ImportError:
+    numba = None
 
 from data.database import get_session, PharmacySales, MedicineType, Pharmacy
-from config import HAT_YAI_ZONES
+from config import HAT_YAI_ZONES, MEDICINE_CATEGORIES
+
+
+# Rolling statistics use pandas' JIT-compiled kernels when numba is installed
+ROLLING_ENGINE = "numba" if numba is not None else "cython"
+
+
+@lru_cache(maxsize=1)
+def _zone_category_pairs() -> Tuple[Tuple[str, str], ...]:
+    """Build every (zone, category) pair once; the config is static"""
+    return tuple(product(HAT_YAI_ZONES, MEDICINE_CATEGORIES))
 
 
 class DataPreprocessor:
     """Preprocess pharmacy sales data for ML models"""
     
-    def __init__(self):
+    def __init__(self, prefetched: Optional[Dict[Tuple[str, str], pd.DataFrame]] = None):
+        """
+        Args:
+            prefetched: Daily sales per (zone_id, category), as returned by
+                prefetch_all(), to serve get_zone_sales() from instead of
+                querying the database
+        """
         self.session = get_session()
+        self._prefetched = prefetched
+    
+    def prefetch_all(self) -> Dict[Tuple[str, str], pd.DataFrame]:
+        """
+        Load the daily sales of every zone-category pair in one query
+        
+        Later get_zone_sales() calls on this preprocessor are answered from
+        the loaded series.
+        
+        Returns:
+            Dict mapping (zone_id, category) to a DataFrame with columns:
+            date, quantity_sold (pairs without sales are left out)
+        """
+        rows = self.session.query(
+            Pharmacy.zone_id,
+            MedicineType.category,
+            PharmacySales.date,
+            func.sum(PharmacySales.quantity_sold).label("quantity_sold")
+        ).join(
+            MedicineType, PharmacySales.medicine_id == MedicineType.id
+        ).join(
+            Pharmacy, PharmacySales.pharmacy_id == Pharmacy.id
+        ).group_by(
+            Pharmacy.zone_id, MedicineType.category, PharmacySales.date
+        ).order_by(
+            Pharmacy.zone_id, MedicineType.category, PharmacySales.date
+        ).all()
+        
+        self._prefetched = {}
+        if rows:
+            zone_ids, categories, dates, quantities = zip(*rows)
+            sales = pd.DataFrame({
+                "zone_id": zone_ids,
+                "category": categories,
+                "date": dates,
+                "quantity_sold": quantities
+            })
+            for pair, group in sales.groupby(["zone_id", "category"], sort=False):
+                self._prefetched[pair] = group[["date", "quantity_sold"]].reset_index(drop=True)
+        
+        return self._prefetched
     
     def get_zone_sales(
         self, 
@@ -40,11 +108,13 @@ class DataPreprocessor:
         Returns:
             DataFrame with columns: date, quantity_sold
         """
+        if self._prefetched is not None:
+            return self._prefetched_sales(zone_id, category, start_date, end_date)
+        
+        # Sum across all pharmacies in the zone in SQL, one row per date
         query = self.session.query(
             PharmacySales.date,
-            PharmacySales.quantity_sold,
-            MedicineType.category,
-            Pharmacy.zone_id
+            func.sum(PharmacySales.quantity_sold).label("quantity_sold")
         ).join(
             MedicineType, PharmacySales.medicine_id == MedicineType.id
         ).join(
@@ -59,21 +129,43 @@ class DataPreprocessor:
         if end_date:
             query = query.filter(PharmacySales.date <= end_date)
         
-        # Execute query and convert to DataFrame
-        results = query.all()
-        df = pd.DataFrame([
-            {"date": r.date, "quantity_sold": r.quantity_sold}
-            for r in results
-        ])
+        query = query.group_by(PharmacySales.date).order_by(PharmacySales.date)
         
-        if df.empty:
+        # Execute query and build the DataFrame column-wise (no intermediate
+        # object array of rows to infer dtypes from)
+        rows = query.all()
+        if not rows:
+            return pd.DataFrame(columns=["date", "quantity_sold"])
+        
+        dates, quantities = zip(*rows)
+        return pd.DataFrame({"date": dates, "quantity_sold": quantities})
+    
+    def _prefetched_sales(
+        self,
+        zone_id: str,
+        category: str,
+        start_date: datetime = None,
+        end_date: datetime = None
+    ) -> pd.DataFrame:
+        """Slice get_zone_sales() results out of the prefetched series"""
+        sales = self._prefetched.get((zone_id, category))
+        if sales is None:
             return pd.DataFrame(columns=["date", "quantity_sold"])
         
-        # Aggregate by date (sum across all pharmacies in zone)
-        df = df.groupby("date").agg({"quantity_sold": "sum"}).reset_index()
-        df = df.sort_values("date")
+        # Callers rename and extend the frame, so hand out a copy
+        if start_date or end_date:
+            dates = sales["date"]
+            keep = np.ones(len(sales), dtype=bool)
+            if start_date:
+                keep &= (dates >= start_date).to_numpy()
+            if end_date:
+                keep &= (dates <= end_date).to_numpy()
+            sales = sales[keep].reset_index(drop=True)
+            if sales.empty:
+                return pd.DataFrame(columns=["date", "quantity_sold"])
+            return sales
         
-        return df
+        return sales.copy()
     
     def prepare_for_prophet(
         self, 
@@ -99,13 +191,11 @@ class DataPreprocessor:
         if df.empty:
             return pd.DataFrame(columns=["ds", "y"])
         
-        # Rename columns for Prophet
-        df_prophet = df.rename(columns={"date": "ds", "quantity_sold": "y"})
+        # Rename columns for Prophet (in place, the frame is freshly built)
+        df.columns = ["ds", "y"]
         
         # Ensure daily frequency (fill missing dates with 0)
-        df_prophet = self._fill_missing_dates(df_prophet)
-        
-        return df_prophet
+        return self._fill_missing_dates(df)
     
     def prepare_for_lstm(
         self,
@@ -137,22 +227,28 @@ class DataPreprocessor:
             return np.array([]), np.array([]), df
         
         # Fill missing dates
-        df = self._fill_missing_dates(df.rename(columns={"date": "ds", "quantity_sold": "y"}))
+        df.columns = ["ds", "y"]
+        df = self._fill_missing_dates(df)
         
         # Normalize data
         values = df["y"].values
         mean = np.mean(values)
         std = np.std(values)
-        normalized = (values - mean) / (std + 1e-8)
         
-        # Create sequences
-        X, y = [], []
-        for i in range(len(normalized) - lookback_days):
-            X.append(normalized[i:i + lookback_days])
-            y.append(normalized[i + lookback_days])
+        # A flat series (e.g. no sales at all) has nothing for the LSTM to
+        # learn; return no sequences so callers skip training and inference
+        if std < 1e-6:
+            return np.array([]), np.array([]), df
+        
+        normalized = values - mean
+        normalized /= std + 1e-8
         
-        X = np.array(X).reshape(-1, lookback_days, 1)
-        y = np.array(y).reshape(-1, 1)
+        # Create sequences from a strided view over the series; the last
+        # window has no target. X is float32, the dtype the model trains in,
+        # while y stays float64 so anomaly scores keep full precision
+        windows = sliding_window_view(normalized, lookback_days)[:-1]
+        X = np.ascontiguousarray(windows, dtype=np.float32)[..., None]
+        y = normalized[lookback_days:, None]
         
         # Store normalization parameters in df
         df["mean"] = mean
@@ -170,57 +266,78 @@ class DataPreprocessor:
         Returns:
             DataFrame with additional features
         """
-        df = df.copy()
+        y = df["y"]
+        values = y.to_numpy(dtype=float)
         
-        # Rolling statistics
-        df["rolling_mean_7d"] = df["y"].rolling(window=7, min_periods=1).mean()
-        df["rolling_std_7d"] = df["y"].rolling(window=7, min_periods=1).std()
-        df["rolling_mean_14d"] = df["y"].rolling(window=14, min_periods=1).mean()
+        # Rolling statistics (std is undefined for the first one-value window,
+        # which takes the next window's value)
+        rolling_7d = y.rolling(window=7, min_periods=1)
+        features = {
+            "rolling_mean_7d": rolling_7d.mean(engine=ROLLING_ENGINE),
+            "rolling_std_7d": rolling_7d.std(engine=ROLLING_ENGINE).bfill().fillna(0),
+            "rolling_mean_14d": y.rolling(window=14, min_periods=1).mean(engine=ROLLING_ENGINE),
+        }
         
         # Lag features
-        df["lag_1d"] = df["y"].shift(1)
-        df["lag_7d"] = df["y"].shift(7)
+        features["lag_1d"] = self._lag(values, 1)
+        features["lag_7d"] = self._lag(values, 7)
         
         # Day of week
-        df["day_of_week"] = pd.to_datetime(df["ds"]).dt.dayofweek
-        df["is_weekend"] = df["day_of_week"].isin([5, 6]).astype(int)
+        day_of_week = pd.to_datetime(df["ds"]).dt.dayofweek.to_numpy().astype(np.int8)
+        features["day_of_week"] = day_of_week
+        features["is_weekend"] = (day_of_week >= 5).view(np.int8)
         
-        # Fill NaN values
-        df = df.fillna(method="bfill").fillna(0)
+        # Add every feature column in one block insert
+        return df.assign(**features)
+    
+    @staticmethod
+    def _lag(values: np.ndarray, periods: int) -> np.ndarray:
+        """
+        Shift a series down by a number of days
         
-        return df
+        Args:
+            values: Series values
+            periods: Number of days to lag
+            
+        Returns:
+            Lagged values; the leading days with no history take the first
+            value, and a series no longer than the lag is all zeros
+        """
+        lagged = np.zeros(len(values))
+        if len(values) > periods:
+            lagged[periods:] = values[:-periods]
+            lagged[:periods] = values[0]
+        return lagged
     
     def _fill_missing_dates(self, df: pd.DataFrame) -> pd.DataFrame:
         """Fill missing dates in time series with 0 values"""
         if df.empty:
             return df
         
-        # Ensure ds is datetime
-        df["ds"] = pd.to_datetime(df["ds"])
+        # Ensure ds is datetime (read out, the input frame is left as is)
+        ds = pd.to_datetime(df["ds"]).to_numpy()
         
-        # Create complete date range
-        date_range = pd.date_range(
-            start=df["ds"].min(),
-            end=df["ds"].max(),
-            freq="D"
-        )
+        # Day offset of each row from the first date; rows off the daily
+        # grid (a different time of day) are not kept, as with a reindex
+        start = ds.min()
+        one_day = np.timedelta64(1, "D")
+        offsets, remainders = np.divmod(ds - start, one_day)
+        on_grid = remainders == np.timedelta64(0, "D")
+        num_days = int(offsets.max()) + 1
         
-        # Reindex and fill missing values
-        df = df.set_index("ds").reindex(date_range, fill_value=0).reset_index()
-        df = df.rename(columns={"index": "ds"})
+        # Scatter values onto a zero-filled daily grid
+        filled = {"ds": start + np.arange(num_days) * one_day}
+        for column in df.columns.drop("ds"):
+            values = df[column].to_numpy()
+            full = np.zeros(num_days, dtype=values.dtype)
+            full[offsets[on_grid]] = values[on_grid]
+            filled[column] = full
         
-        return df
+        return pd.DataFrame(filled)
     
     def get_all_zone_category_pairs(self) -> List[Tuple[str, str]]:
         """Get all valid zone-category combinations"""
-        from config import MEDICINE_CATEGORIES
-        
-        pairs = []
-        for zone_id in HAT_YAI_ZONES.keys():
-            for category in MEDICINE_CATEGORIES.keys():
-                pairs.append((zone_id, category))
-        
-        return pairs
+        return list(_zone_category_pairs())
     
     def close(self):
         """Close database session"""
@@ -2,10 +2,6 @@
 Simple demo of the stock monitoring bot
 """
 import asyncio
-from pathlib import Path
-import sys
-
-sys.path.append(str(Path(__file__).parent))
 
 from bots.playwright_scraper import PlaywrightScraper
 
@@ -4,15 +4,50 @@ Provides more robust anomaly detection through weighted voting
 """
 import pandas as pd
 import numpy as np
-from typing import Dict, Tuple
+from dataclasses import dataclass, fields
+from typing import Dict, Optional, Tuple, Union
 import sys
 from pathlib import Path
 
-sys.path.append(str(Path(__file__).parent.parent))
+if __name__ == "__main__":
+    sys.path.append(str(Path(__file__).parent.parent))
 
 from models.prophet_detector import ProphetDetector
 from models.lstm_detector import LSTMDetector
-from config import MODEL_CONFIG, ANOMALY_THRESHOLDS
+from models.severity import SEVERITY_DTYPE, classify_severity
+from config import MODEL_CONFIG, HAT_YAI_ZONES
+
+
+@dataclass
+class AnomalyResults:
+    """Ensemble detection results, one numpy array per column"""
+    ds: np.ndarray
+    actual: np.ndarray
+    prophet_score: np.ndarray
+    lstm_score: np.ndarray
+    ensemble_score: np.ndarray
+    prophet_anomaly: np.ndarray
+    lstm_anomaly: np.ndarray
+    is_anomaly: np.ndarray
+    severity: pd.Categorical
+    model_agreement: np.ndarray
+    
+    def __len__(self) -> int:
+        return len(self.ds)
+    
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame) -> "AnomalyResults":
+        """Wrap the columns of a detect_anomalies() DataFrame"""
+        columns = {field.name: df[field.name].to_numpy() for field in fields(cls)}
+        columns["severity"] = pd.Categorical(df["severity"], dtype=SEVERITY_DTYPE)
+        return cls(**columns)
+    
+    def to_frame(self) -> pd.DataFrame:
+        """Materialize the results as a DataFrame"""
+        return pd.DataFrame(
+            {field.name: getattr(self, field.name) for field in fields(self)},
+            copy=False
+        )
 
 
 class EnsembleDetector:
@@ -75,6 +110,29 @@ class EnsembleDetector:
         Returns:
             DataFrame with ensemble anomaly detection results
         """
+        return self.detect_anomalies_fast(
+            df_prophet, X_lstm, y_lstm, threshold_std=threshold_std
+        ).to_frame()
+    
+    def detect_anomalies_fast(
+        self,
+        df_prophet: pd.DataFrame,
+        X_lstm: np.ndarray,
+        y_lstm: np.ndarray,
+        threshold_std: float = 2.0
+    ) -> AnomalyResults:
+        """
+        Detect anomalies using ensemble approach, without building a DataFrame
+        
+        Args:
+            df_prophet: Prophet format data
+            X_lstm: LSTM input sequences
+            y_lstm: LSTM actual values
+            threshold_std: Anomaly threshold
+            
+        Returns:
+            AnomalyResults with the same columns as detect_anomalies()
+        """
         # Get Prophet results
         prophet_results = self.prophet_detector.detect_anomalies(
             df_prophet, 
@@ -88,81 +146,70 @@ class EnsembleDetector:
             threshold_std=threshold_std
         )
         
-        # Align results (LSTM has fewer samples due to lookback)
+        # Align results (LSTM has fewer samples due to lookback) with
+        # positional views instead of a sliced, re-indexed copy
         lookback = self.lstm_detector.lookback_days
-        prophet_aligned = prophet_results.iloc[lookback:].reset_index(drop=True)
+        prophet_scores = prophet_results["anomaly_score"].to_numpy()[lookback:]
+        lstm_scores = lstm_results["anomaly_score"].to_numpy()
         
         # Combine anomaly scores
         ensemble_score = (
-            prophet_aligned["anomaly_score"].values * self.prophet_weight +
-            lstm_results["anomaly_score"].values * self.lstm_weight
+            prophet_scores * self.prophet_weight +
+            lstm_scores * self.lstm_weight
         )
         
-        # Create ensemble results
-        results = pd.DataFrame({
-            "ds": prophet_aligned["ds"].values,
-            "actual": prophet_aligned["y"].values,
-            "prophet_score": prophet_aligned["anomaly_score"].values,
-            "lstm_score": lstm_results["anomaly_score"].values,
-            "ensemble_score": ensemble_score,
-            "prophet_anomaly": prophet_aligned["is_anomaly"].values,
-            "lstm_anomaly": lstm_results["is_anomaly"].values
-        })
-        
-        # Ensemble anomaly detection
-        results["is_anomaly"] = results["ensemble_score"] > threshold_std
-        
-        # Classify severity
-        results["severity"] = results["ensemble_score"].apply(
-            lambda x: self._classify_severity(x)
+        prophet_anomaly = prophet_results["is_anomaly"].to_numpy()[lookback:]
+        lstm_anomaly = lstm_results["is_anomaly"].to_numpy()
+        
+        return AnomalyResults(
+            ds=prophet_results["ds"].to_numpy()[lookback:],
+            actual=prophet_results["y"].to_numpy()[lookback:],
+            prophet_score=prophet_scores,
+            lstm_score=lstm_scores,
+            ensemble_score=ensemble_score,
+            prophet_anomaly=prophet_anomaly,
+            lstm_anomaly=lstm_anomaly,
+            is_anomaly=ensemble_score > threshold_std,
+            severity=self._classify_severity(ensemble_score),
+            model_agreement=np.equal(prophet_anomaly, lstm_anomaly).view(np.int8)
         )
-        
-        # Calculate agreement
-        results["model_agreement"] = (
-            results["prophet_anomaly"] == results["lstm_anomaly"]
-        ).astype(int)
-        
-        return results
     
-    def _classify_severity(self, anomaly_score: float) -> str:
-        """Classify anomaly severity"""
-        if anomaly_score < ANOMALY_THRESHOLDS["low"]:
-            return "normal"
-        elif anomaly_score < ANOMALY_THRESHOLDS["medium"]:
-            return "low"
-        elif anomaly_score < ANOMALY_THRESHOLDS["high"]:
-            return "medium"
-        elif anomaly_score < ANOMALY_THRESHOLDS["critical"]:
-            return "high"
-        else:
-            return "critical"
+    def _classify_severity(
+        self,
+        anomaly_scores: Union[float, np.ndarray]
+    ) -> Union[str, pd.Categorical]:
+        """Classify anomaly severity (one binary search per score)"""
+        return classify_severity(anomaly_scores)
     
-    def calculate_confidence(self, results: pd.DataFrame) -> float:
+    def calculate_confidence(self, results: Union[pd.DataFrame, AnomalyResults]) -> float:
         """
         Calculate ensemble confidence score
         
         Args:
-            results: DataFrame from detect_anomalies()
+            results: Results from detect_anomalies() or detect_anomalies_fast()
             
         Returns:
             Confidence score (0-1)
         """
-        if results.empty:
+        if len(results) == 0:
             return 0.0
         
+        if isinstance(results, pd.DataFrame):
+            results = AnomalyResults.from_frame(results)
+        
         # Get individual confidences
         prophet_conf = self._calculate_model_confidence(
-            results["prophet_score"].values,
-            results["prophet_anomaly"].values
+            results.prophet_score,
+            results.prophet_anomaly
         )
         
         lstm_conf = self._calculate_model_confidence(
-            results["lstm_score"].values,
-            results["lstm_anomaly"].values
+            results.lstm_score,
+            results.lstm_anomaly
         )
         
         # Model agreement factor
-        recent_agreement = results.tail(3)["model_agreement"].mean()
+        recent_agreement = results.model_agreement[-3:].mean()
         
         # Weighted ensemble confidence
         base_confidence = (
@@ -192,15 +239,13 @@ class EnsembleDetector:
             return 0.0
         
         # Average score
-        avg_score = recent_scores[recent_anomalies].mean() if recent_anomalies.any() else 0
+        avg_score = recent_scores[recent_anomalies].mean()
         
-        # Consecutive anomalies
-        consecutive = 0
-        for i in range(len(anomalies) - 1, -1, -1):
-            if anomalies[i]:
-                consecutive += 1
-            else:
-                break
+        # Consecutive anomalies (trailing run after the last normal point)
+        normal_points = np.flatnonzero(~np.asarray(anomalies, dtype=bool))
+        consecutive = (
+            len(anomalies) - 1 - int(normal_points[-1]) if normal_points.size else len(anomalies)
+        )
         
         # Confidence
         score_conf = min(avg_score / 5.0, 1.0)
@@ -210,42 +255,54 @@ class EnsembleDetector:
     
     def get_alert_message(
         self,
-        results: pd.DataFrame,
+        results: Union[pd.DataFrame, AnomalyResults],
         zone_id: str,
-        category: str
+        category: str,
+        confidence: Optional[float] = None
     ) -> Dict:
         """
         Generate alert message with details
         
         Args:
-            results: Anomaly detection results
+            results: Results from detect_anomalies() or detect_anomalies_fast()
             zone_id: Zone identifier
             category: Medicine category
+            confidence: calculate_confidence(results), if the caller
+                already has it
             
         Returns:
             Alert message dictionary
         """
-        recent_anomalies = results[results["is_anomaly"]].tail(3)
+        if isinstance(results, pd.DataFrame):
+            results = AnomalyResults.from_frame(results)
+        
+        anomaly_indices = np.flatnonzero(results.is_anomaly)
         
-        if recent_anomalies.empty:
+        if not anomaly_indices.size:
             return None
         
-        latest = recent_anomalies.iloc[-1]
-        confidence = self.calculate_confidence(results)
+        latest = anomaly_indices[-1]
+        if confidence is None:
+            confidence = self.calculate_confidence(results)
         
         # Check if confidence meets threshold
         if confidence < self.config["confidence_threshold"]:
             return None
         
+        severity = results.severity[latest]
+        detected_at = results.ds[latest]
+        if isinstance(detected_at, np.datetime64):
+            detected_at = pd.Timestamp(detected_at)
+        
         alert = {
             "zone_id": zone_id,
             "category": category,
-            "severity": latest["severity"],
-            "ensemble_score": float(latest["ensemble_score"]),
+            "severity": severity,
+            "ensemble_score": float(results.ensemble_score[latest]),
             "confidence": float(confidence),
-            "model_agreement": bool(latest["model_agreement"]),
-            "detected_at": latest["ds"].isoformat() if hasattr(latest["ds"], "isoformat") else str(latest["ds"]),
-            "message": self._generate_message(zone_id, category, latest["severity"], confidence)
+            "model_agreement": bool(results.model_agreement[latest]),
+            "detected_at": detected_at.isoformat() if hasattr(detected_at, "isoformat") else str(detected_at),
+            "message": self._generate_message(zone_id, category, severity, confidence)
         }
         
         return alert
@@ -258,8 +315,6 @@ class EnsembleDetector:
         confidence: float
     ) -> str:
         """Generate human-readable alert message"""
-        from config import HAT_YAI_ZONES
-        
         zone_name = HAT_YAI_ZONES.get(zone_id, {}).get("name", zone_id)
         
         category_thai = {
@@ -2,14 +2,17 @@
 LSTM-based anomaly detection for Drugstore Canary
 Uses LSTM neural network for sequential pattern learning and anomaly detection
 """
+import json
 import numpy as np
 import pandas as pd
 from datetime import datetime, timedelta
-from typing import Dict, Tuple, Optional
+from functools import lru_cache
+from typing import Dict, Tuple, Optional, Union
 import sys
 from pathlib import Path
 
-sys.path.append(str(Path(__file__).parent.parent))
+if __name__ == "__main__":
+    sys.path.append(str(Path(__file__).parent.parent))
 
 try:
     import tensorflow as tf
@@ -21,7 +24,39 @@ except ImportError:
     keras = None
     layers = None
 
-from config import MODEL_CONFIG, ANOMALY_THRESHOLDS
+from config import MODEL_CONFIG
+from models.severity import classify_severity
+
+# Inference batch size; inputs up to this many windows run as a single batch
+PREDICT_BATCH_SIZE = 1024
+
+# Training examples held in the tf.data shuffle buffer
+SHUFFLE_BUFFER_SIZE = 1024
+
+
+@lru_cache(maxsize=1)
+def _mixed_precision_policy() -> Optional[str]:
+    """
+    Pick the Keras dtype policy for the LSTM layers
+    
+    Returns:
+        "mixed_bfloat16" when the GPU (Ampere or newer) or the CPU
+        (AVX-512 BF16 / AMX) has native BF16 units, otherwise None
+    """
+    try:
+        for gpu in tf.config.list_physical_devices("GPU"):
+            details = tf.config.experimental.get_device_details(gpu)
+            if details.get("compute_capability", (0, 0)) >= (8, 0):
+                return "mixed_bfloat16"
+        
+        cpu_flags = Path("/proc/cpuinfo").read_text()
+    except (OSError, RuntimeError, ValueError):
+        return None
+    
+    if "avx512_bf16" in cpu_flags or "amx_bf16" in cpu_flags:
+        return "mixed_bfloat16"
+    
+    return None
 
 
 class LSTMDetector:
@@ -33,6 +68,7 @@ class LSTMDetector:
         
         self.config = config or MODEL_CONFIG["lstm"]
         self.model = None
+        self._tflite = None
         self.mean = 0
         self.std = 1
         self.lookback_days = self.config["lookback_days"]
@@ -44,25 +80,31 @@ class LSTMDetector:
         Args:
             input_shape: Shape of input data (lookback_days, features)
         """
+        # BF16 compute where the hardware has it; the output layer stays
+        # float32 so the regression target and loss keep full precision
+        policy = _mixed_precision_policy()
+        
         model = keras.Sequential([
             # First LSTM layer
             layers.LSTM(
                 self.config["lstm_units"][0],
                 return_sequences=True,
-                input_shape=input_shape
+                input_shape=input_shape,
+                dtype=policy
             ),
-            layers.Dropout(self.config["dropout_rate"]),
+            layers.Dropout(self.config["dropout_rate"], dtype=policy),
             
             # Second LSTM layer
             layers.LSTM(
                 self.config["lstm_units"][1],
-                return_sequences=False
+                return_sequences=False,
+                dtype=policy
             ),
-            layers.Dropout(self.config["dropout_rate"]),
+            layers.Dropout(self.config["dropout_rate"], dtype=policy),
             
             # Dense layers
-            layers.Dense(16, activation="relu"),
-            layers.Dense(1)
+            layers.Dense(16, activation="relu", dtype=policy),
+            layers.Dense(1, dtype="float32")
         ])
         
         # Compile model
@@ -101,20 +143,48 @@ class LSTMDetector:
             input_shape = (X_train.shape[1], X_train.shape[2])
             self.build_model(input_shape)
         
-        # Train model
-        history = self.model.fit(
-            X_train, y_train,
-            epochs=self.config["epochs"],
-            batch_size=self.config["batch_size"],
-            validation_split=validation_split,
-            verbose=verbose,
-            callbacks=[
+        # Hold out the last samples for validation, as fit(validation_split=)
+        # does, since a Dataset cannot be split by fit itself. Training keeps
+        # at least one sample, so a very short series trains unvalidated
+        X_train = np.asarray(X_train, dtype=np.float32)
+        y_train = np.asarray(y_train, dtype=np.float32)
+        n_samples = len(X_train)
+        split = min(max(int(n_samples * (1 - validation_split)), 1), n_samples)
+        
+        train_data = (
+            tf.data.Dataset.from_tensor_slices((X_train[:split], y_train[:split]))
+            .cache()
+            .shuffle(SHUFFLE_BUFFER_SIZE)
+            .batch(self.config["batch_size"])
+            .prefetch(tf.data.AUTOTUNE)
+        )
+        validation_data = None
+        callbacks = []
+        if split < n_samples:
+            validation_data = (
+                tf.data.Dataset.from_tensor_slices((X_train[split:], y_train[split:]))
+                .batch(self.config["batch_size"])
+                .cache()
+                .prefetch(tf.data.AUTOTUNE)
+            )
+            
+            # val_loss only exists when there is validation data
+            callbacks.append(
                 keras.callbacks.EarlyStopping(
                     monitor="val_loss",
                     patience=10,
                     restore_best_weights=True
                 )
-            ]
+            )
+        
+        # Train model (a quantized copy loaded from disk is now stale)
+        self._tflite = None
+        history = self.model.fit(
+            train_data,
+            epochs=self.config["epochs"],
+            validation_data=validation_data,
+            verbose=verbose,
+            callbacks=callbacks
         )
         
         return history.history
@@ -129,10 +199,33 @@ class LSTMDetector:
         Returns:
             Predictions (n_samples, 1)
         """
+        if self._tflite is not None:
+            return self._tflite_predict(X)
+        
         if self.model is None:
             raise ValueError("Model not trained. Call train() first.")
         
-        return self.model.predict(X, verbose=0)
+        # A single series fits in one batch: call the model directly instead
+        # of paying predict()'s per-call data pipeline setup
+        if len(X) <= PREDICT_BATCH_SIZE:
+            return self.model(tf.convert_to_tensor(X, dtype=tf.float32), training=False).numpy()
+        
+        return self.model.predict(X, batch_size=PREDICT_BATCH_SIZE, verbose=0)
+    
+    def _tflite_predict(self, X: np.ndarray) -> np.ndarray:
+        """Run the loaded quantized TFLite model on a batch of sequences"""
+        input_detail = self._tflite.get_input_details()[0]
+        output_detail = self._tflite.get_output_details()[0]
+        
+        # Resize only when the number of windows changes
+        if input_detail["shape"][0] != len(X):
+            self._tflite.resize_tensor_input(input_detail["index"], X.shape)
+            self._tflite.allocate_tensors()
+        
+        self._tflite.set_tensor(input_detail["index"], X.astype(np.float32, copy=False))
+        self._tflite.invoke()
+        
+        return self._tflite.get_tensor(output_detail["index"]).copy()
     
     def detect_anomalies(
         self,
@@ -157,44 +250,38 @@ class LSTMDetector:
         # Generate predictions
         y_pred = self.predict(X)
         
-        # Calculate reconstruction error
-        errors = np.abs(y_actual - y_pred)
+        # Calculate reconstruction error in one buffer
+        errors = np.subtract(y_actual, y_pred)
+        np.abs(errors, out=errors)
         
-        # Calculate anomaly scores
+        # Calculate anomaly scores, reusing the centered errors for the std
         error_mean = np.mean(errors)
-        error_std = np.std(errors) + 1e-8
-        anomaly_scores = (errors - error_mean) / error_std
+        anomaly_scores = errors - error_mean
+        error_std = np.sqrt(np.mean(np.square(anomaly_scores))) + 1e-8
+        anomaly_scores /= error_std
         
-        # Create results DataFrame
+        # Create results DataFrame (ravel gives views, the frame copies once)
         results = pd.DataFrame({
-            "actual": y_actual.flatten(),
-            "predicted": y_pred.flatten(),
-            "error": errors.flatten(),
-            "anomaly_score": anomaly_scores.flatten()
+            "actual": y_actual.ravel(),
+            "predicted": y_pred.ravel(),
+            "error": errors.ravel(),
+            "anomaly_score": anomaly_scores.ravel()
         })
         
         # Detect anomalies
         results["is_anomaly"] = results["anomaly_score"] > threshold_std
         
         # Classify severity
-        results["severity"] = results["anomaly_score"].apply(
-            lambda x: self._classify_severity(x)
-        )
+        results["severity"] = self._classify_severity(results["anomaly_score"])
         
         return results
     
-    def _classify_severity(self, anomaly_score: float) -> str:
+    def _classify_severity(
+        self,
+        anomaly_scores: Union[float, pd.Series]
+    ) -> Union[str, pd.Categorical]:
         """Classify anomaly severity based on score"""
-        if anomaly_score < ANOMALY_THRESHOLDS["low"]:
-            return "normal"
-        elif anomaly_score < ANOMALY_THRESHOLDS["medium"]:
-            return "low"
-        elif anomaly_score < ANOMALY_THRESHOLDS["high"]:
-            return "medium"
-        elif anomaly_score < ANOMALY_THRESHOLDS["critical"]:
-            return "high"
-        else:
-            return "critical"
+        return classify_severity(anomaly_scores)
     
     def calculate_confidence(self, results: pd.DataFrame) -> float:
         """
@@ -226,33 +313,37 @@ class LSTMDetector:
         score_confidence = min(avg_score / 5.0, 1.0)
         consistency_confidence = min(consecutive_count / 3.0, 1.0)
         
+        # Weighted sum of two parts clamped to 1, so at most 1 itself
         confidence = (score_confidence * 0.6 + consistency_confidence * 0.4)
         
-        return min(confidence, 1.0)
+        return confidence
     
     def _count_consecutive_anomalies(self, results: pd.DataFrame) -> int:
         """Count consecutive anomalies at the end"""
         if results.empty:
             return 0
         
-        count = 0
-        for i in range(len(results) - 1, -1, -1):
-            if results.iloc[i]["is_anomaly"]:
-                count += 1
-            else:
-                break
-        
-        return count
+        # The run ends right after the last non-anomalous row
+        is_anomaly = results["is_anomaly"].to_numpy(dtype=bool)
+        normal_rows = np.flatnonzero(~is_anomaly)
+        return len(is_anomaly) - 1 - int(normal_rows[-1]) if normal_rows.size else len(is_anomaly)
     
-    def save_model(self, filepath: str) -> None:
-        """Save trained model"""
+    def save_model(self, filepath: str, representative_data: Optional[np.ndarray] = None) -> None:
+        """
+        Save trained model, with a quantized TFLite copy for inference
+        
+        Args:
+            filepath: Path of the .h5 Keras model
+            representative_data: Sample input sequences used to calibrate
+                int8 activations; weights only are quantized without it
+        """
         if self.model is None:
             raise ValueError("No model to save")
         
         self.model.save(filepath)
+        self._save_tflite(filepath.replace(".h5", ".tflite"), representative_data)
         
         # Save config separately
-        import json
         config_path = filepath.replace(".h5", "_config.json")
         with open(config_path, "w") as f:
             json.dump({
@@ -262,11 +353,52 @@ class LSTMDetector:
                 "lookback_days": self.lookback_days
             }, f)
     
-    def load_model(self, filepath: str) -> None:
-        """Load trained model"""
-        import json
+    def _save_tflite(self, filepath: str, representative_data: Optional[np.ndarray]) -> None:
+        """
+        Convert the model to post-training quantized TFLite
+        
+        Args:
+            filepath: Output .tflite path
+            representative_data: Calibration sequences for int8 activations
+        """
+        try:
+            converter = tf.lite.TFLiteConverter.from_keras_model(self.model)
+            converter.optimizations = [tf.lite.Optimize.DEFAULT]
+            
+            if representative_data is not None and len(representative_data):
+                samples = representative_data.astype(np.float32, copy=False)
+                converter.representative_dataset = lambda: (
+                    [samples[i:i + 1]] for i in range(min(len(samples), 200))
+                )
+                # int8 kernels where available, float I/O for callers
+                converter.target_spec.supported_ops = [
+                    tf.lite.OpsSet.TFLITE_BUILTINS_INT8,
+                    tf.lite.OpsSet.TFLITE_BUILTINS
+                ]
+            
+            Path(filepath).write_bytes(converter.convert())
+        except Exception as e:
+            print(f"Error exporting TFLite model: {e}")
+    
+    def load_model(self, filepath: str, use_tflite: bool = False) -> None:
+        """
+        Load trained model
         
+        Args:
+            filepath: Path to the saved .h5 model
+            use_tflite: Serve predictions from the quantized .tflite copy
+                saved alongside it instead of the Keras model
+        """
         self.model = keras.models.load_model(filepath)
+        self._tflite = None
+        
+        if use_tflite:
+            tflite_path = Path(filepath.replace(".h5", ".tflite"))
+            if tflite_path.exists():
+                self._tflite = tf.lite.Interpreter(model_path=str(tflite_path))
+                self._tflite.allocate_tensors()
+            else:
+                print(f"Warning: {tflite_path} not found, using the Keras model")
         
         # Load config
         config_path = filepath.replace(".h5", "_config.json")
@@ -2,14 +2,19 @@
 Prophet-based anomaly detection for Drugstore Canary
 Uses Facebook Prophet for time-series forecasting and anomaly detection
 """
+import hashlib
+import pickle
+import threading
 import pandas as pd
 import numpy as np
+from collections import OrderedDict
 from datetime import datetime, timedelta
-from typing import Dict, Tuple, Optional
+from typing import Dict, Tuple, Optional, Union
 import sys
 from pathlib import Path
 
-sys.path.append(str(Path(__file__).parent.parent))
+if __name__ == "__main__":
+    sys.path.append(str(Path(__file__).parent.parent))
 
 try:
     from prophet import Prophet
@@ -17,7 +22,71 @@ except ImportError:
     print("Warning: Prophet not installed. Run: pip install prophet")
     Prophet = None
 
-from config import MODEL_CONFIG, ANOMALY_THRESHOLDS
+try:
+    import joblib
+except ImportError:
+    joblib = None
+
+from config import MODEL_CONFIG
+from models.severity import classify_severity
+
+# joblib compression for saved models (zlib ships with Python, unlike lz4)
+MODEL_COMPRESSION = ("zlib", 3)
+
+# Fitted models shared across detectors, keyed by training data and config
+# (most recently used last), each with its in-sample forecast key and forecast
+FITTED_MODEL_CACHE_SIZE = 32
+_fitted_models: "OrderedDict[bytes, Tuple[Prophet, bytes, pd.DataFrame]]" = OrderedDict()
+_fitted_models_lock = threading.Lock()
+
+
+def _dates_key(ds: pd.Series) -> bytes:
+    """
+    Fingerprint a date column independent of its dtype
+    
+    Args:
+        ds: Dates as strings, datetimes or datetime64 values
+        
+    Returns:
+        Raw datetime64[ns] bytes of the dates
+    """
+    return pd.to_datetime(ds).to_numpy().astype("datetime64[ns]").tobytes()
+
+
+def _training_key(df: pd.DataFrame, config: Dict) -> bytes:
+    """
+    Fingerprint a training set and model config
+    
+    Args:
+        df: DataFrame with columns 'ds' (date) and 'y' (value)
+        config: Prophet model config
+        
+    Returns:
+        Digest identifying the fit
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(_dates_key(df["ds"]))
+    digest.update(df["y"].to_numpy(dtype=np.float64).tobytes())
+    digest.update(repr(sorted(config.items())).encode())
+    return digest.digest()
+
+
+def _trailing_true_count(flags: np.ndarray) -> int:
+    """
+    Count the True values ending a boolean array
+    
+    Args:
+        flags: Boolean array in date order
+        
+    Returns:
+        Length of the final run of True values
+    """
+    # argmin finds no False in an all-True array, so that case is separate
+    if flags.all():
+        return flags.size
+    
+    # The first False from the end closes the run
+    return int(np.argmin(flags[::-1]))
 
 
 class ProphetDetector:
@@ -33,6 +102,10 @@ class ProphetDetector:
         self.mean = 0
         self.std = 1
         
+        # In-sample forecast of the fitted model, keyed by the dates it covers
+        self._fitted_forecast_key: Optional[bytes] = None
+        self._fitted_forecast: Optional[pd.DataFrame] = None
+        
     def train(self, df: pd.DataFrame) -> None:
         """
         Train Prophet model on historical data
@@ -47,6 +120,16 @@ class ProphetDetector:
         self.mean = df["y"].mean()
         self.std = df["y"].std() + 1e-8
         
+        # The same history and config always fit the same model
+        key = _training_key(df, self.config)
+        with _fitted_models_lock:
+            cached = _fitted_models.get(key)
+            if cached is not None:
+                _fitted_models.move_to_end(key)
+        if cached is not None:
+            self.model, self._fitted_forecast_key, self._fitted_forecast = cached
+            return
+        
         # Initialize Prophet model
         self.model = Prophet(
             changepoint_prior_scale=self.config["changepoint_prior_scale"],
@@ -60,6 +143,17 @@ class ProphetDetector:
         # Fit model
         self.model.fit(df)
         
+        # Forecast the training dates now: detect_anomalies() on the same df
+        # follows every fit, and the cached model then brings it along
+        self._fitted_forecast_key = _dates_key(df["ds"])
+        self._fitted_forecast = self.model.predict(df[["ds"]])
+        
+        with _fitted_models_lock:
+            _fitted_models[key] = (self.model, self._fitted_forecast_key, self._fitted_forecast)
+            _fitted_models.move_to_end(key)
+            if len(_fitted_models) > FITTED_MODEL_CACHE_SIZE:
+                _fitted_models.popitem(last=False)
+        
     def predict(self, periods: int = 30) -> pd.DataFrame:
         """
         Generate forecast for future periods
@@ -73,11 +167,24 @@ class ProphetDetector:
         if self.model is None:
             raise ValueError("Model not trained. Call train() first.")
         
-        # Create future dataframe
-        future = self.model.make_future_dataframe(periods=periods)
-        
-        # Generate forecast
-        self.forecast = self.model.predict(future)
+        # Future dates after the history, as make_future_dataframe() builds them
+        history_dates = self.model.history_dates
+        last_date = history_dates.iloc[-1]
+        future_dates = pd.date_range(start=last_date, periods=periods + 1, freq="D")
+        future_dates = future_dates[future_dates > last_date][:periods]
+        
+        # The history part is the in-sample forecast train() already made, so
+        # only the future rows need a Prophet pass
+        if _dates_key(history_dates) == self._fitted_forecast_key:
+            future_forecast = self.model.predict(pd.DataFrame({"ds": future_dates}))
+            self.forecast = pd.concat(
+                [self._fitted_forecast, future_forecast], ignore_index=True
+            )
+        else:
+            future = pd.DataFrame({
+                "ds": np.concatenate((history_dates.to_numpy(), future_dates.to_numpy()))
+            })
+            self.forecast = self.model.predict(future)
         
         return self.forecast
     
@@ -100,45 +207,45 @@ class ProphetDetector:
             # Train if not already trained
             self.train(df)
         
-        # Generate forecast for the same period
-        forecast = self.model.predict(df[["ds"]])
-        
-        # Merge actual and predicted
-        results = df.copy()
-        results["yhat"] = forecast["yhat"]
-        results["yhat_lower"] = forecast["yhat_lower"]
-        results["yhat_upper"] = forecast["yhat_upper"]
-        
-        # Calculate residuals
-        results["residual"] = results["y"] - results["yhat"]
-        results["residual_abs"] = np.abs(results["residual"])
-        
-        # Calculate anomaly score (normalized residual)
-        residual_std = results["residual"].std() + 1e-8
-        results["anomaly_score"] = results["residual_abs"] / residual_std
-        
-        # Detect anomalies
-        results["is_anomaly"] = results["anomaly_score"] > threshold_std
-        
-        # Classify severity
-        results["severity"] = results["anomaly_score"].apply(
-            lambda x: self._classify_severity(x)
-        )
+        # Generate forecast for the same period (the forecast depends only on
+        # the dates, so repeated detection on them reuses the last one)
+        forecast_key = _dates_key(df["ds"])
+        if forecast_key != self._fitted_forecast_key:
+            self._fitted_forecast = self.model.predict(df[["ds"]])
+            self._fitted_forecast_key = forecast_key
+        forecast = self._fitted_forecast
+        
+        # Calculate residuals on the raw arrays
+        yhat = forecast["yhat"].to_numpy()
+        residual = df["y"].to_numpy(dtype=np.float64) - yhat
+        residual_abs = np.abs(residual)
+        
+        # Calculate anomaly score (normalized residual, sample std as pandas)
+        residual_std = residual.std(ddof=1) + 1e-8
+        anomaly_score = residual_abs / residual_std
+        
+        # Merge actual and predicted in one construction; df's own columns
+        # are shared (copy-on-write) rather than copied
+        results = pd.DataFrame({
+            **{column: df[column] for column in df.columns},
+            "yhat": yhat,
+            "yhat_lower": forecast["yhat_lower"].to_numpy(),
+            "yhat_upper": forecast["yhat_upper"].to_numpy(),
+            "residual": residual,
+            "residual_abs": residual_abs,
+            "anomaly_score": anomaly_score,
+            "is_anomaly": anomaly_score > threshold_std,
+            "severity": self._classify_severity(anomaly_score)
+        }, copy=False)
         
         return results
     
-    def _classify_severity(self, anomaly_score: float) -> str:
+    def _classify_severity(
+        self,
+        anomaly_scores: Union[float, pd.Series]
+    ) -> Union[str, pd.Categorical]:
         """Classify anomaly severity based on score"""
-        if anomaly_score < ANOMALY_THRESHOLDS["low"]:
-            return "normal"
-        elif anomaly_score < ANOMALY_THRESHOLDS["medium"]:
-            return "low"
-        elif anomaly_score < ANOMALY_THRESHOLDS["high"]:
-            return "medium"
-        elif anomaly_score < ANOMALY_THRESHOLDS["critical"]:
-            return "high"
-        else:
-            return "critical"
+        return classify_severity(anomaly_scores)
     
     def get_recent_anomalies(
         self, 
@@ -158,12 +265,10 @@ class ProphetDetector:
         if results.empty:
             return results
         
-        # Get recent data
+        # Recent anomalies, selected with one combined mask
         cutoff_date = results["ds"].max() - timedelta(days=days)
-        recent = results[results["ds"] >= cutoff_date]
-        
-        # Filter anomalies
-        anomalies = recent[recent["is_anomaly"] == True]
+        is_recent = (results["ds"] >= cutoff_date).to_numpy()
+        anomalies = results[is_recent & results["is_anomaly"].to_numpy(dtype=bool)]
         
         return anomalies
     
@@ -180,6 +285,10 @@ class ProphetDetector:
         if results.empty or "anomaly_score" not in results.columns:
             return 0.0
         
+        # No anomalies at all (the common case): skip the date filtering
+        if not results["is_anomaly"].to_numpy(dtype=bool).any():
+            return 0.0
+        
         # Recent anomalies
         recent_anomalies = self.get_recent_anomalies(results, days=3)
         
@@ -196,66 +305,72 @@ class ProphetDetector:
         score_confidence = min(avg_score / 5.0, 1.0)  # Normalize to 0-1
         consistency_confidence = min(consecutive_days / 3.0, 1.0)  # 3+ days = high confidence
         
-        # Combined confidence
+        # Combined confidence (both parts are clamped to 1,
+        # so their weighted sum already is)
         confidence = (score_confidence * 0.6 + consistency_confidence * 0.4)
         
-        return min(confidence, 1.0)
+        return confidence
     
     def _count_consecutive_anomalies(self, results: pd.DataFrame) -> int:
         """Count consecutive anomaly days at the end of the series"""
         if results.empty:
             return 0
         
-        # Sort by date
-        results = results.sort_values("ds", ascending=False)
-        
-        # Count consecutive anomalies from most recent
-        count = 0
-        for _, row in results.iterrows():
-            if row["is_anomaly"]:
-                count += 1
-            else:
-                break
+        # Flags in date order, without a copy of the frame
+        order = np.argsort(results["ds"].to_numpy(), kind="stable")
+        is_anomaly = results["is_anomaly"].to_numpy(dtype=bool)[order]
         
-        return count
+        return int(_trailing_true_count(is_anomaly))
     
     def save_model(self, filepath: str) -> None:
-        """Save trained model to file"""
-        import pickle
-        
+        """Save trained model to file (compressed with joblib when installed)"""
         if self.model is None:
             raise ValueError("No model to save")
         
+        data = {
+            "model": self.model,
+            "config": self.config,
+            "mean": self.mean,
+            "std": self.std
+        }
+        
+        if joblib is not None:
+            joblib.dump(data, filepath, compress=MODEL_COMPRESSION)
+            return
+        
         with open(filepath, "wb") as f:
-            pickle.dump({
-                "model": self.model,
-                "config": self.config,
-                "mean": self.mean,
-                "std": self.std
-            }, f)
+            pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
     
     def load_model(self, filepath: str) -> None:
         """Load trained model from file"""
-        import pickle
-        
-        with open(filepath, "rb") as f:
-            data = pickle.load(f)
-            self.model = data["model"]
-            self.config = data["config"]
-            self.mean = data["mean"]
-            self.std = data["std"]
+        # joblib.load also reads plain pickle files
+        if joblib is not None:
+            data = joblib.load(filepath)
+        else:
+            with open(filepath, "rb") as f:
+                data = pickle.load(f)
+        
+        self.model = data["model"]
+        self.config = data["config"]
+        self.mean = data["mean"]
+        self.std = data["std"]
+        self._fitted_forecast_key = None
+        self._fitted_forecast = None
 
 
 if __name__ == "__main__":
     # Test Prophet detector
     print("Testing Prophet Anomaly Detector...")
     
-    # Create sample data
+    # Create sample data (the weekly signal is built here rather than at
+    # module scope, so importing the detector in training workers stays free)
+    np.random.seed(42)
     dates = pd.date_range(start="2024-01-01", periods=100, freq="D")
-    values = 20 + 5 * np.sin(np.arange(100) * 2 * np.pi / 7) + np.random.normal(0, 2, 100)
+    values = 20 + 5 * np.sin(np.arange(100) * 2 * np.pi / 7)
+    values += np.random.normal(0, 2, 100)
     
     # Inject anomaly
-    values[80:85] = values[80:85] * 3
+    values[80:85] *= 3
     
     df = pd.DataFrame({"ds": dates, "y": values})
     
@@ -0,0 +1,43 @@
+"""
+Anomaly severity bands shared by the Drugstore Canary detectors
+Maps anomaly scores to the levels defined by ANOMALY_THRESHOLDS
+"""
+import numpy as np
+import pandas as pd
+from typing import Union
+import sys
+from pathlib import Path
+
+if __name__ == "__main__":
+    sys.path.append(str(Path(__file__).parent.parent))
+
+from config import ANOMALY_THRESHOLDS
+
+
+# Lower bound of each severity band, and the label for each band: below
+# ANOMALY_THRESHOLDS["low"] is normal, and so on
+SEVERITY_THRESHOLDS = np.array([
+    ANOMALY_THRESHOLDS[level] for level in ("low", "medium", "high", "critical")
+])
+SEVERITY_LABELS = np.array(["normal", "low", "medium", "high", "critical"], dtype=object)
+SEVERITY_DTYPE = pd.CategoricalDtype(SEVERITY_LABELS, ordered=True)
+
+
+def classify_severity(
+    anomaly_scores: Union[float, np.ndarray, pd.Series]
+) -> Union[str, pd.Categorical]:
+    """
+    Classify anomaly severity based on score (one binary search per score)
+    
+    Args:
+        anomaly_scores: A single score or an array of scores
+    
+    Returns:
+        Severity label for a single score, otherwise an ordered categorical
+        with one int8 code per score instead of a str object
+    """
+    codes = np.searchsorted(SEVERITY_THRESHOLDS, np.asarray(anomaly_scores), side="right")
+    if codes.ndim == 0:
+        return SEVERITY_LABELS[codes]
+    
+    return pd.Categorical.from_codes(codes, dtype=SEVERITY_DTYPE)
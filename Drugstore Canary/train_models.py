@@ -2,13 +2,15 @@
 Training script for Drugstore Canary models
 Trains Prophet, LSTM, and Ensemble models on all zone-category pairs
 """
-import sys
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
+from typing import Dict, List, Optional, Tuple
 import numpy as np
+import pandas as pd
 from datetime import datetime
 
-sys.path.append(str(Path(__file__).parent))
-
 from data.preprocessor import DataPreprocessor
 from models.prophet_detector import ProphetDetector
 from models.lstm_detector import LSTMDetector
@@ -16,112 +18,197 @@ from models.ensemble_model import EnsembleDetector
 from config import HAT_YAI_ZONES, MEDICINE_CATEGORIES
 
 
-def train_all_models(save_models: bool = True):
+def _train_pair(
+    zone_id: str,
+    category: str,
+    sales: Optional[pd.DataFrame],
+    idx: int,
+    total_pairs: int,
+    save_models: bool
+) -> Tuple[Optional[Dict], List[str]]:
+    """
+    Train and evaluate the models of one zone-category pair
+    
+    Runs in a worker process, so it works from the pair's prefetched sales
+    and returns its progress output instead of printing it.
+    
+    Args:
+        zone_id: Zone identifier
+        category: Medicine category
+        sales: Daily sales of the pair (None if it has none)
+        idx: Position of the pair (1-based), for progress output
+        total_pairs: Number of pairs being trained
+        save_models: Whether to save trained models to disk
+        
+    Returns:
+        Tuple of (result summary, or None if skipped or failed, output lines)
+    """
+    lines = []
+    log = lines.append
+    preprocessor = DataPreprocessor(prefetched={(zone_id, category): sales})
+    
+    zone_name = HAT_YAI_ZONES[zone_id]["name"]
+    log(f"\n[{idx}/{total_pairs}] Training: {zone_name} - {category}")
+    log("-" * 60)
+    
+    try:
+        # Prepare data
+        log("  📊 Preparing data...")
+        df_prophet = preprocessor.prepare_for_prophet(zone_id, category)
+        
+        if df_prophet.empty or len(df_prophet) < 30:
+            log(f"  ⚠️  Insufficient data ({len(df_prophet)} days), skipping...")
+            return None, lines
+        
+        X_lstm, y_lstm, _ = preprocessor.prepare_for_lstm(
+            zone_id, category, lookback_days=14
+        )
+        
+        if len(X_lstm) == 0:
+            log(f"  ⚠️  Insufficient LSTM data, skipping...")
+            return None, lines
+        
+        log(f"  ✓ Data prepared: {len(df_prophet)} days")
+        
+        # Train Prophet
+        log("  🔮 Training Prophet model...")
+        prophet = ProphetDetector()
+        prophet.train(df_prophet)
+        prophet_results = prophet.detect_anomalies(df_prophet)
+        prophet_conf = prophet.calculate_confidence(prophet_results)
+        log(f"  ✓ Prophet trained (confidence: {prophet_conf:.2f})")
+        
+        # Train LSTM
+        log("  🧠 Training LSTM model...")
+        lstm = LSTMDetector()
+        lstm.train(X_lstm, y_lstm, verbose=0)
+        lstm_results = lstm.detect_anomalies(X_lstm, y_lstm)
+        lstm_conf = lstm.calculate_confidence(lstm_results)
+        log(f"  ✓ LSTM trained (confidence: {lstm_conf:.2f})")
+        
+        # Train Ensemble
+        log("  🎯 Training Ensemble model...")
+        ensemble = EnsembleDetector()
+        ensemble.train(df_prophet, X_lstm, y_lstm)
+        ensemble_results = ensemble.detect_anomalies(df_prophet, X_lstm, y_lstm)
+        ensemble_conf = ensemble.calculate_confidence(ensemble_results)
+        log(f"  ✓ Ensemble trained (confidence: {ensemble_conf:.2f})")
+        
+        # Detect anomalies
+        anomalies = ensemble_results[ensemble_results["is_anomaly"]].tail(5)
+        if not anomalies.empty:
+            log(f"  🚨 Recent anomalies detected: {len(anomalies)}")
+            for _, row in anomalies.iterrows():
+                log(f"     - {row['ds']}: {row['severity']} (score: {row['ensemble_score']:.2f})")
+        else:
+            log(f"  ✅ No anomalies detected")
+        
+        # Save models if requested
+        if save_models:
+            models_dir = Path(__file__).parent / "trained_models"
+            models_dir.mkdir(exist_ok=True)
+            
+            model_prefix = f"{zone_id}_{category}"
+            prophet.save_model(str(models_dir / f"{model_prefix}_prophet.pkl"))
+            lstm.save_model(
+                str(models_dir / f"{model_prefix}_lstm.h5"),
+                representative_data=X_lstm
+            )
+            log(f"  💾 Models saved to trained_models/")
+        
+        # Store results
+        return {
+            "zone_id": zone_id,
+            "zone_name": zone_name,
+            "category": category,
+            "prophet_confidence": prophet_conf,
+            "lstm_confidence": lstm_conf,
+            "ensemble_confidence": ensemble_conf,
+            "anomalies_detected": len(anomalies),
+            "data_points": len(df_prophet)
+        }, lines
+        
+    except Exception as e:
+        log(f"  ❌ Error: {e}")
+        return None, lines
+    finally:
+        preprocessor.close()
+
+
+def _init_worker(threads: int) -> None:
+    """
+    Limit TensorFlow's thread pools in a training worker
+    
+    Every worker otherwise sizes its pools to the whole machine, so the
+    pools are split between workers (TensorFlow reads these settings when
+    its runtime first starts, which is after this runs).
+    
+    Args:
+        threads: Intra-op threads for this worker
+    """
+    os.environ["TF_NUM_INTEROP_THREADS"] = "1"
+    os.environ["TF_NUM_INTRAOP_THREADS"] = str(threads)
+
+
+def _collect_results(outcomes) -> List[Dict]:
+    """Print each pair's output and keep the results of trained pairs"""
+    results = []
+    for result, lines in outcomes:
+        print("\n".join(lines))
+        if result is not None:
+            results.append(result)
+    
+    return results
+
+
+def train_all_models(save_models: bool = True, workers: Optional[int] = None):
     """
     Train models for all zone-category combinations
     
     Args:
         save_models: Whether to save trained models to disk
+        workers: Number of pairs trained in parallel processes
+            (defaults to half the CPU count, 1 trains in this process)
     """
     print("=" * 60)
     print("Drugstore Canary - Model Training")
     print("=" * 60)
     
+    # Get all zone-category pairs, and every pair's sales in one query
     preprocessor = DataPreprocessor()
-    results = []
-    
-    # Get all zone-category pairs
     pairs = preprocessor.get_all_zone_category_pairs()
     total_pairs = len(pairs)
+    sales = preprocessor.prefetch_all()
+    preprocessor.close()
     
     print(f"\nTraining models for {total_pairs} zone-category combinations...")
     print(f"Zones: {len(HAT_YAI_ZONES)}")
     print(f"Categories: {len(MEDICINE_CATEGORIES)}\n")
     
-    for idx, (zone_id, category) in enumerate(pairs, 1):
-        zone_name = HAT_YAI_ZONES[zone_id]["name"]
-        print(f"\n[{idx}/{total_pairs}] Training: {zone_name} - {category}")
-        print("-" * 60)
-        
-        try:
-            # Prepare data
-            print("  📊 Preparing data...")
-            df_prophet = preprocessor.prepare_for_prophet(zone_id, category)
-            
-            if df_prophet.empty or len(df_prophet) < 30:
-                print(f"  ⚠️  Insufficient data ({len(df_prophet)} days), skipping...")
-                continue
-            
-            X_lstm, y_lstm, _ = preprocessor.prepare_for_lstm(
-                zone_id, category, lookback_days=14
-            )
-            
-            if len(X_lstm) == 0:
-                print(f"  ⚠️  Insufficient LSTM data, skipping...")
-                continue
-            
-            print(f"  ✓ Data prepared: {len(df_prophet)} days")
-            
-            # Train Prophet
-            print("  🔮 Training Prophet model...")
-            prophet = ProphetDetector()
-            prophet.train(df_prophet)
-            prophet_results = prophet.detect_anomalies(df_prophet)
-            prophet_conf = prophet.calculate_confidence(prophet_results)
-            print(f"  ✓ Prophet trained (confidence: {prophet_conf:.2f})")
-            
-            # Train LSTM
-            print("  🧠 Training LSTM model...")
-            lstm = LSTMDetector()
-            lstm.train(X_lstm, y_lstm, verbose=0)
-            lstm_results = lstm.detect_anomalies(X_lstm, y_lstm)
-            lstm_conf = lstm.calculate_confidence(lstm_results)
-            print(f"  ✓ LSTM trained (confidence: {lstm_conf:.2f})")
-            
-            # Train Ensemble
-            print("  🎯 Training Ensemble model...")
-            ensemble = EnsembleDetector()
-            ensemble.train(df_prophet, X_lstm, y_lstm)
-            ensemble_results = ensemble.detect_anomalies(df_prophet, X_lstm, y_lstm)
-            ensemble_conf = ensemble.calculate_confidence(ensemble_results)
-            print(f"  ✓ Ensemble trained (confidence: {ensemble_conf:.2f})")
-            
-            # Detect anomalies
-            anomalies = ensemble_results[ensemble_results["is_anomaly"]].tail(5)
-            if not anomalies.empty:
-                print(f"  🚨 Recent anomalies detected: {len(anomalies)}")
-                for _, row in anomalies.iterrows():
-                    print(f"     - {row['ds']}: {row['severity']} (score: {row['ensemble_score']:.2f})")
-            else:
-                print(f"  ✅ No anomalies detected")
-            
-            # Save models if requested
-            if save_models:
-                models_dir = Path(__file__).parent / "trained_models"
-                models_dir.mkdir(exist_ok=True)
-                
-                model_prefix = f"{zone_id}_{category}"
-                prophet.save_model(str(models_dir / f"{model_prefix}_prophet.pkl"))
-                lstm.save_model(str(models_dir / f"{model_prefix}_lstm.h5"))
-                print(f"  💾 Models saved to trained_models/")
-            
-            # Store results
-            results.append({
-                "zone_id": zone_id,
-                "zone_name": zone_name,
-                "category": category,
-                "prophet_confidence": prophet_conf,
-                "lstm_confidence": lstm_conf,
-                "ensemble_confidence": ensemble_conf,
-                "anomalies_detected": len(anomalies),
-                "data_points": len(df_prophet)
-            })
-            
-        except Exception as e:
-            print(f"  ❌ Error: {e}")
-            continue
+    # Pairs are independent, so each is trained in its own process; output
+    # is printed per pair, in order, as the pairs finish
+    cpu_count = os.cpu_count() or 1
+    if workers is None:
+        workers = max(cpu_count // 2, 1)
     
-    preprocessor.close()
+    jobs = [
+        (zone_id, category, sales.get((zone_id, category)), idx, total_pairs, save_models)
+        for idx, (zone_id, category) in enumerate(pairs, 1)
+    ]
+    
+    if workers <= 1:
+        outcomes = (_train_pair(*job) for job in jobs)
+        results = _collect_results(outcomes)
+    else:
+        # spawn: TensorFlow is not fork-safe once imported
+        workers = min(workers, total_pairs)
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(max(cpu_count // workers, 1),)
+        ) as executor:
+            results = _collect_results(executor.map(_train_pair, *zip(*jobs)))
     
     # Print summary
     print("\n" + "=" * 60)
@@ -132,9 +219,10 @@ def train_all_models(save_models: bool = True):
         print(f"\nSuccessfully trained: {len(results)}/{total_pairs} combinations\n")
         
         # Average confidences
-        avg_prophet = np.mean([r["prophet_confidence"] for r in results])
-        avg_lstm = np.mean([r["lstm_confidence"] for r in results])
-        avg_ensemble = np.mean([r["ensemble_confidence"] for r in results])
+        avg_prophet, avg_lstm, avg_ensemble = (
+            np.fromiter((r[key] for r in results), dtype=np.float64, count=len(results)).mean()
+            for key in ("prophet_confidence", "lstm_confidence", "ensemble_confidence")
+        )
         
         print(f"Average Confidence Scores:")
         print(f"  Prophet:  {avg_prophet:.2f}")
@@ -142,7 +230,7 @@ def train_all_models(save_models: bool = True):
         print(f"  Ensemble: {avg_ensemble:.2f}")
         
         # Total anomalies
-        total_anomalies = sum([r["anomalies_detected"] for r in results])
+        total_anomalies = sum(r["anomalies_detected"] for r in results)
         print(f"\nTotal Anomalies Detected: {total_anomalies}")
         
         # High-risk zones
@@ -170,7 +258,13 @@ if __name__ == "__main__":
         action="store_true",
         help="Don't save trained models to disk"
     )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="Zone-category pairs trained in parallel (default: half the CPU count)"
+    )
     
     args = parser.parse_args()
     
-    results = train_all_models(save_models=not args.no_save)
+    results = train_all_models(save_models=not args.no_save, workers=args.workers)
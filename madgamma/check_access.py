@@ -1,14 +1,26 @@
+from concurrent.futures import ThreadPoolExecutor
+import sys
+
 from huggingface_hub import model_info
 from huggingface_hub.utils import RepositoryNotFoundError, GatedRepoError
 
-model_id = "google/medgemma-4b-it"
-
-try:
-    info = model_info(model_id)
-    print(f"Access granted to {model_id}")
-except GatedRepoError:
-    print(f"Access DENIED to {model_id}. Please accept terms at https://huggingface.co/{model_id}")
-except RepositoryNotFoundError:
-    print(f"Model {model_id} not found.")
-except Exception as e:
-    print(f"An error occurred: {e}")
+# Models to check: command line arguments, or MedGemma by default
+model_ids = sys.argv[1:] or ["google/medgemma-4b-it"]
+
+
+def check_access(model_id):
+    try:
+        model_info(model_id)
+        return f"Access granted to {model_id}"
+    except GatedRepoError:
+        return f"Access DENIED to {model_id}. Please accept terms at https://huggingface.co/{model_id}"
+    except RepositoryNotFoundError:
+        return f"Model {model_id} not found."
+    except Exception as e:
+        return f"An error occurred: {e}"
+
+
+# Each check is one HTTPS round-trip, so run them concurrently
+with ThreadPoolExecutor(max_workers=min(len(model_ids), 8)) as executor:
+    for message in executor.map(check_access, model_ids):
+        print(message)
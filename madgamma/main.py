@@ -5,6 +5,10 @@ import os
 
 model_id = "google/medgemma-4b-it"
 
+# Gemma chat template, with the 256 image soft tokens expanded once
+IMAGE_TOKENS = "<image_soft_token>" * 256
+PROMPT_TEMPLATE = "<start_of_turn>user\n{image}\n{prompt}<end_of_turn>\n<start_of_turn>model\n"
+
 print(f"Loading model: {model_id}...")
 try:
     processor = AutoProcessor.from_pretrained(model_id)
@@ -18,12 +22,16 @@ try:
         dtype = torch.float32
         print("Using CPU (MPS not available).")
 
+    # Load the weights straight onto the device in the target dtype instead
+    # of building the model on CPU first and copying it over
     model = AutoModelForImageTextToText.from_pretrained(
         model_id,
-        device_map=None,
-        torch_dtype=dtype
-    ).to(device)
-    print("Model loaded. Moving to device...")
+        device_map={"": device},
+        torch_dtype=dtype,
+        low_cpu_mem_usage=True,
+        attn_implementation="sdpa"  # Fused scaled-dot-product attention kernel
+    )
+    print(f"Model loaded on {device}.")
     print("Model and processor loaded successfully.")
 except Exception as e:
     print(f"Failed to load model/processor: {e}")
@@ -65,19 +73,15 @@ else:
 
 # Prompt
 if image:
-    # Gemma chat template
-    image_token = "<image_soft_token>"
-    num_image_tokens = 256
-    
     # Construct prompt with chat template
     user_prompt = "Analyze this X-ray and summarize the findings."
-    input_text = f"<start_of_turn>user\n{image_token * num_image_tokens}\n{user_prompt}<end_of_turn>\n<start_of_turn>model\n"
+    input_text = PROMPT_TEMPLATE.format(image=IMAGE_TOKENS, prompt=user_prompt)
     
     # Manually assemble inputs to bypass processor validation bug
     try:
         # Process image
         image_inputs = processor.image_processor(images=image, return_tensors="pt")
-        pixel_values = image_inputs.pixel_values.to(model.device, dtype=model.dtype)
+        pixel_values = image_inputs.pixel_values.to(model.device, dtype=model.dtype, non_blocking=True)
         
         # Process text
         text_inputs = processor.tokenizer(input_text, return_tensors="pt")
@@ -102,7 +106,15 @@ else:
     inputs = processor(text=input_text, return_tensors="pt").to(model.device)
 
 print("Generating...")
-outputs = model.generate(**inputs, max_new_tokens=200)
+# Greedy decoding with the KV cache; no autograd bookkeeping is needed
+with torch.inference_mode():
+    outputs = model.generate(
+        **inputs,
+        max_new_tokens=200,
+        do_sample=False,
+        use_cache=True,
+        pad_token_id=processor.tokenizer.eos_token_id
+    )
 print(f"DEBUG: Output shape: {outputs.shape}")
 print(f"DEBUG: Output tokens: {outputs[0].tolist()}")
 decoded_text = processor.decode(outputs[0][inputs['input_ids'].shape[1]:], skip_special_tokens=True)